@@ -0,0 +1,390 @@
+#! /usr/bin/env python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+analyze_churn.py --reference <locale> --path <folder> [--file <name>]
+     [--project <name>] [--since <git-ref>] [--locales] [--limit <n>]
+     [--json <file>]
+
+ Report which trans-unit IDs of the reference XLIFF file change most often in
+ the git history, and how many translations those changes invalidated, to
+ help planning string freezes.
+
+ Every version of the reference file (following first parents, oldest first)
+ is read through a single 'git cat-file --batch' process, instead of starting
+ one git process per commit. Each version is indexed by <file> and ID, and
+ compared with the previous one. For each ID:
+ - 'changes': number of versions changing its source text (same <file>).
+ - 'moves': number of versions moving it to a different <file>.
+ - 'added', 'removed': number of times it was added or removed.
+
+ --locales also reads each locale's file as it was right before every source
+ change (through the same cat-file process), and counts the translations
+ invalidated by the change: in 'standard' mode, update_other_locales.py
+ removes a translation when its source text changes. A locale file version
+ already parsed (same blob) is reused.
+
+ --since only analyzes the commits after a git reference (e.g. a tag).
+ --json writes the stats of every ID to a file.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+from functions import list_locales, scan_file_nodes
+from locale_config import PROJECTS, get_project_config
+from lxml import etree
+
+
+def run_git(repo_folder, *args):
+    """Run a git command in 'repo_folder' and return its output."""
+    try:
+        return subprocess.run(
+            ["git", "-C", repo_folder, *args],
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        ).stdout
+    except subprocess.CalledProcessError as e:
+        sys.exit(f"ERROR: git {args[0]} failed\n{e.stderr}")
+
+
+def list_versions(repo_folder, path, since=None):
+    """
+    Return [(commit, timestamp)] for the first-parent commits changing 'path'
+    (relative to the repository root), oldest first.
+    """
+    revision = f"{since}..HEAD" if since else "HEAD"
+    output = run_git(
+        repo_folder,
+        "log",
+        "--first-parent",
+        "--reverse",
+        "--format=%H %ct",
+        revision,
+        "--",
+        path,
+    )
+    versions = []
+    for line in output.splitlines():
+        commit, timestamp = line.split()
+        versions.append((commit, int(timestamp)))
+    return versions
+
+
+def read_object(cat_file, name):
+    """
+    Request an object (e.g. '<commit>:<path>') from a running
+    'git cat-file --batch' process, and return (blob ID, content), or
+    (None, None) if it doesn't exist.
+    """
+    cat_file.stdin.write(f"{name}\n".encode("utf-8"))
+    cat_file.stdin.flush()
+    header = cat_file.stdout.readline().split()
+    if len(header) != 3:
+        # '<name> missing', or '<name> ambiguous'.
+        return None, None
+    object_id, _, size = header
+    content = cat_file.stdout.read(int(size))
+    # Each object is followed by a newline.
+    cat_file.stdout.read(1)
+    return object_id, content
+
+
+def index_units(content):
+    """
+    Index an XLIFF document as {(original, id): (source, translated)}, where
+    'translated' is True if the unit has a <target>.
+    """
+    root = etree.fromstring(content)
+    index = {}
+    for file_node, units in scan_file_nodes(root):
+        original = file_node.get("original")
+        for trans_node, source, target in units:
+            index[(original, trans_node.get("id"))] = (
+                source.text if source is not None else None,
+                target is not None,
+            )
+    return index
+
+
+def group_by_id(index):
+    """Return {id: {original: source}} for a unit index."""
+    by_id = {}
+    for (original, tu_id), (source, _) in index.items():
+        by_id.setdefault(tu_id, {})[original] = source
+    return by_id
+
+
+def diff_versions(previous, current):
+    """
+    Compare two versions grouped by ID (see group_by_id), and return
+    (events, changed_units): events as (id, kind) tuples, kind being 'changes',
+    'moves', 'added' or 'removed', and the (original, id) keys of the units
+    whose source text changed.
+    """
+    events = []
+    changed_units = []
+    for tu_id in previous.keys() | current.keys():
+        before = previous.get(tu_id)
+        after = current.get(tu_id)
+        if before is None:
+            events.append((tu_id, "added"))
+            continue
+        if after is None:
+            events.append((tu_id, "removed"))
+            continue
+        if before == after:
+            continue
+        changed = [
+            original
+            for original in before.keys() & after.keys()
+            if before[original] != after[original]
+        ]
+        if changed:
+            events.append((tu_id, "changes"))
+            changed_units.extend((original, tu_id) for original in changed)
+        if before.keys() != after.keys():
+            events.append((tu_id, "moves"))
+    return events, changed_units
+
+
+def count_invalidated(cat_file, commit, locale_paths, changed_units, cache):
+    """
+    Return {(original, id): number of locales} for the units in
+    'changed_units' that were translated right before 'commit'. 'cache' maps
+    blob IDs to the set of translated units, to parse each version once.
+    """
+    invalidated = {}
+    for path in locale_paths:
+        object_id, content = read_object(cat_file, f"{commit}^:{path}")
+        if object_id is None:
+            continue
+        if object_id not in cache:
+            try:
+                index = index_units(content)
+            except Exception as e:
+                print(f"WARNING: Can't parse {path} at {commit}^\n{e}")
+                index = {}
+            cache[object_id] = {
+                key for key, (_, translated) in index.items() if translated
+            }
+        translated = cache[object_id]
+        for key in changed_units:
+            if key in translated:
+                invalidated[key] = invalidated.get(key, 0) + 1
+    return invalidated
+
+
+def analyze(repo_folder, reference_path, versions, locale_paths=None, since=None):
+    """
+    Walk the versions of the reference file and return (stats, analyzed
+    versions), with stats as {id: {"changes", "moves", "added", "removed",
+    "invalidated", "last_change"}}. "invalidated" is None without
+    'locale_paths'.
+    """
+    stats = {}
+    cache = {}
+    analyzed = 0
+    cat_file = subprocess.Popen(
+        ["git", "-C", repo_folder, "cat-file", "--batch"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+    try:
+        previous = None
+        previous_id = None
+        if since:
+            previous_id, content = read_object(cat_file, f"{since}:{reference_path}")
+            if previous_id is not None:
+                previous = group_by_id(index_units(content))
+
+        for commit, timestamp in versions:
+            object_id, content = read_object(cat_file, f"{commit}:{reference_path}")
+            if object_id is None:
+                # File removed in this commit.
+                previous = None
+                previous_id = None
+                continue
+            if object_id == previous_id:
+                continue
+            try:
+                current = group_by_id(index_units(content))
+            except Exception as e:
+                print(f"WARNING: Can't parse {reference_path} at {commit}\n{e}")
+                continue
+            analyzed += 1
+            if previous is not None:
+                events, changed_units = diff_versions(previous, current)
+                invalidated = {}
+                if locale_paths and changed_units:
+                    invalidated = count_invalidated(
+                        cat_file, commit, locale_paths, changed_units, cache
+                    )
+                for tu_id, kind in events:
+                    unit_stats = stats.setdefault(
+                        tu_id,
+                        {
+                            "changes": 0,
+                            "moves": 0,
+                            "added": 0,
+                            "removed": 0,
+                            "invalidated": 0 if locale_paths else None,
+                            "last_change": None,
+                        },
+                    )
+                    unit_stats[kind] += 1
+                    unit_stats["last_change"] = timestamp
+                for (_, tu_id), count in invalidated.items():
+                    stats[tu_id]["invalidated"] += count
+            previous = current
+            previous_id = object_id
+    finally:
+        cat_file.stdin.close()
+        cat_file.wait()
+
+    for unit_stats in stats.values():
+        unit_stats["last_change"] = (
+            datetime.fromtimestamp(unit_stats["last_change"], timezone.utc)
+            .date()
+            .isoformat()
+        )
+    return stats, analyzed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--reference",
+        required=True,
+        dest="reference_locale",
+        help="Locale code for source strings (usually en-US)",
+    )
+    parser.add_argument(
+        "--path",
+        required=True,
+        dest="base_folder",
+        help="Path to folder including subfolders for all locales (in a git "
+        "repository)",
+    )
+    parser.add_argument(
+        "--file",
+        required=False,
+        default="firefox-ios.xliff",
+        dest="filename",
+        help="XLIFF file to analyze, relative to the locale folder "
+        "(default: firefox-ios.xliff)",
+    )
+    parser.add_argument(
+        "--project",
+        required=False,
+        default=None,
+        choices=sorted(PROJECTS),
+        help="Project config to use (excluded folders) with --locales. "
+        "Defaults to no excluded folders.",
+    )
+    parser.add_argument(
+        "--since",
+        required=False,
+        default=None,
+        help="Only analyze commits after this git reference",
+    )
+    parser.add_argument(
+        "--locales",
+        action="store_true",
+        dest="with_locales",
+        help="Count translations invalidated by each change (slower)",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=20,
+        help="Number of IDs to display (default: 20)",
+    )
+    parser.add_argument(
+        "--json",
+        required=False,
+        default=None,
+        dest="json_file",
+        help="Write the stats of every ID to this file in JSON format",
+    )
+    args = parser.parse_args()
+
+    base_folder = os.path.realpath(args.base_folder)
+    repo_folder = run_git(base_folder, "rev-parse", "--show-toplevel").strip()
+    prefix = os.path.relpath(base_folder, repo_folder)
+    if prefix == ".":
+        prefix = ""
+
+    def repo_path(locale):
+        # Paths in git objects always use '/'.
+        return "/".join(
+            part for part in (prefix, locale, args.filename) if part
+        ).replace(os.sep, "/")
+
+    reference_path = repo_path(args.reference_locale)
+    versions = list_versions(repo_folder, reference_path, args.since)
+    if not versions:
+        sys.exit(f"No commit found for {reference_path}")
+
+    locale_paths = None
+    if args.with_locales:
+        config = get_project_config(args.project)
+        locale_paths = [
+            repo_path(locale)
+            for locale in list_locales(
+                base_folder,
+                excluded=config["excluded_folders"],
+                skip=[args.reference_locale],
+            )
+        ]
+
+    stats, analyzed = analyze(
+        repo_folder, reference_path, versions, locale_paths, args.since
+    )
+
+    if args.json_file:
+        with open(args.json_file, "w", encoding="utf-8") as f:
+            json.dump(
+                [{"id": tu_id, **stats[tu_id]} for tu_id in sorted(stats)],
+                f,
+                indent=2,
+                ensure_ascii=False,
+            )
+
+    print(
+        f"{analyzed} versions of {reference_path} analyzed, "
+        f"{len(stats)} IDs changed."
+    )
+    ranking = sorted(
+        stats.items(),
+        key=lambda item: (
+            -item[1]["changes"],
+            -(item[1]["invalidated"] or 0),
+            -item[1]["moves"],
+            item[0],
+        ),
+    )
+    for tu_id, unit_stats in ranking[: args.limit]:
+        invalidated = (
+            f", {unit_stats['invalidated']} translations invalidated"
+            if unit_stats["invalidated"] is not None
+            else ""
+        )
+        print(
+            f"  {tu_id}: {unit_stats['changes']} changes, "
+            f"{unit_stats['moves']} moves{invalidated} "
+            f"(last change: {unit_stats['last_change']})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#! /usr/bin/env python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+benchmark_startup.py [--runs <n>] [--tolerance <ratio>] [--update]
+
+ Measure the cold-start import time of every script in this folder, and fail
+ if one got slower than its baseline in startup_baseline.json, or has no
+ baseline.
+
+ Each script is started with '--help' in a fresh interpreter under
+ 'python -X importtime', and its import time is the sum of the cumulative
+ times of the top-level imports (the interpreter's own startup included). The
+ fastest of several runs is kept, to limit noise.
+
+ Absolute times depend on the machine, so each script is measured relative
+ to a reference taken in the same run, alternating with the script: a bare
+ interpreter, importing nothing. The baseline stores these ratios (1.0 means
+ as fast as starting the interpreter).
+
+ To keep startup fast, modules that are slow to import or only needed for
+ some options (lxml, concurrent.futures, bundle.py...) are imported in the
+ functions using them, so '--help' or an invalid argument don't pay for them.
+
+ A script regresses when its ratio exceeds the baseline by more than
+ 'tolerance' (0.5 by default, i.e. 50% slower) plus a fixed margin. Use
+ --update to store the current ratios as the new baseline, e.g. after
+ intentionally adding a dependency.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from glob import glob
+
+SCRIPTS_FOLDER = os.path.dirname(os.path.realpath(__file__))
+BASELINE_FILE = os.path.join(SCRIPTS_FOLDER, "startup_baseline.json")
+
+# Command used as reference: interpreter startup only.
+REFERENCE_COMMAND = ["-c", "pass"]
+# Margin added to the tolerance (as a ratio of the reference time), so that
+# very fast scripts don't fail on timer noise.
+MARGIN = 0.1
+
+
+def list_entry_points():
+    """Return the file names of the scripts that can be run directly."""
+    entry_points = []
+    for script_path in sorted(glob(os.path.join(SCRIPTS_FOLDER, "*.py"))):
+        if os.path.realpath(script_path) == os.path.realpath(__file__):
+            continue
+        with open(script_path, encoding="utf-8") as f:
+            if 'if __name__ == "__main__":' in f.read():
+                entry_points.append(os.path.basename(script_path))
+    return entry_points
+
+
+def measure_import_time(arguments):
+    """
+    Run the interpreter with 'arguments' (e.g. a script and '--help') under
+    -X importtime, and return its total import time in milliseconds.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime"] + arguments,
+        cwd=SCRIPTS_FOLDER,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    total_us = 0
+    for line in result.stderr.splitlines():
+        # Format: "import time: <self us> | <cumulative us> | <name>", with the
+        # name indented by nesting level: one space means a top-level import.
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if not cumulative.strip().isdigit():
+            # Header line.
+            continue
+        if not name.startswith("  "):
+            total_us += int(cumulative)
+    return total_us / 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=5,
+        help="Number of runs per script, the fastest is kept (default: 5)",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="Allowed slowdown over the baseline, as a ratio (default: 0.5)",
+    )
+    parser.add_argument(
+        "--update",
+        action="store_true",
+        help="Store the current import times as the new baseline",
+    )
+    args = parser.parse_args()
+
+    ratios = {}
+    for script in list_entry_points():
+        # Alternate reference and script runs, so that both see the same
+        # machine load.
+        reference_times = []
+        script_times = []
+        for _ in range(args.runs):
+            reference_times.append(measure_import_time(REFERENCE_COMMAND))
+            script_times.append(measure_import_time([script, "--help"]))
+        ratios[script] = round(min(script_times) / min(reference_times), 2)
+
+    if args.update:
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(ratios, f, indent=4, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline updated for {len(ratios)} scripts.")
+        return
+
+    try:
+        with open(BASELINE_FILE, encoding="utf-8") as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        sys.exit(f"No baseline found, create one with --update ({BASELINE_FILE})")
+
+    regressions = []
+    missing = []
+    for script, current in ratios.items():
+        reference = baseline.get(script)
+        if reference is None:
+            print(f"{script}: {current:.2f}x (no baseline)")
+            missing.append(script)
+            continue
+        limit = reference * (1 + args.tolerance) + MARGIN
+        status = "REGRESSION" if current > limit else "ok"
+        print(f"{script}: {current:.2f}x (baseline {reference:.2f}x) {status}")
+        if current > limit:
+            regressions.append(script)
+
+    if missing:
+        print(f"No baseline for: {', '.join(missing)} (add them with --update)")
+    if regressions:
+        print(f"Startup time regressed for: {', '.join(regressions)}")
+    if missing or regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
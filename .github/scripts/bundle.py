@@ -0,0 +1,430 @@
+#! /usr/bin/env python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+bundle.py pack --reference <locale> --path <folder> --output <bundle>
+     [--project <name>] [locales...]
+bundle.py unpack --bundle <bundle> --output <folder> [locales...]
+bundle.py list --bundle <bundle>
+
+ Store the XLIFF files of all locales in a single compressed bundle, e.g. to
+ copy the whole localization tree for offline analysis, and restore them
+ byte for byte.
+
+ Each file is split into segments: one per <file> element, and the text
+ around them. Segments are compressed with zlib in chunks of about
+ CHUNK_SIZE bytes, cut after a </trans-unit>. Localized chunks use the
+ matching part of the reference file (same <file>, same trans-unit IDs) as
+ preset dictionary: sources, notes and markup are stored once, in the
+ reference, and each locale mostly costs its translations.
+
+ An index at the end of the bundle gives the position of every chunk, so
+ readers can load a single file, or a single <file> element, without
+ decompressing anything else (see open_bundle(), read_file() and
+ read_file_block()).
+
+ Bundle layout: MAGIC, chunks, index (zlib-compressed JSON), and a footer
+ with the offset and length of the index. The index is
+ {"version", "reference", "locales": {locale: {file: {"size", "sha256",
+ "segments": [[original, [[offset, length, dict_start, dict_end], ...]]]}}}},
+ 'original' being None for text between <file> elements, and
+ dict_start:dict_end the range of the reference file used as dictionary.
+"""
+
+import argparse
+import io
+import json
+import os
+import re
+import struct
+import sys
+import zlib
+from glob import glob
+
+from functions import (
+    FILE_TAG,
+    digest_content,
+    list_locales,
+    split_segments,
+    write_content,
+)
+from locale_config import PROJECTS, get_project_config
+from lxml import etree
+
+MAGIC = b"L10NBUNDLE\x01"
+FORMAT_VERSION = 1
+# Offset and length of the index.
+FOOTER = struct.Struct(">QQ")
+CHUNK_SIZE = 16384
+# zlib only uses the last 32 KB of a preset dictionary.
+ZDICT_SIZE = 32768
+UNIT_PATTERN = re.compile(rb"<trans-unit\s[^>]*?\bid=\"([^\"]*)\"")
+UNIT_END = b"</trans-unit>"
+
+
+def split_chunks(content, start, end):
+    """
+    Return the (start, end) ranges of the chunks of a segment, cutting after
+    the first </trans-unit> following every CHUNK_SIZE bytes.
+    """
+    chunks = []
+    while start < end:
+        cut = content.find(UNIT_END, start + CHUNK_SIZE, end)
+        cut = end if cut < 0 else cut + len(UNIT_END)
+        chunks.append((start, cut))
+        start = cut
+    return chunks
+
+
+def index_reference(content):
+    """
+    Index a reference document for dictionary lookups, as
+    {"files": {original: (start, end)}, "units": {original: {id: (start,
+    end)}}, "texts": [(start, end)]}.
+    """
+    reference = {"files": {}, "units": {}, "texts": []}
+    for original, start, end in split_segments(content):
+        if original is None:
+            reference["texts"].append((start, end))
+            continue
+        reference["files"].setdefault(original, (start, end))
+        units = reference["units"].setdefault(original, {})
+        for match in UNIT_PATTERN.finditer(content, start, end):
+            unit_end = content.find(UNIT_END, match.start(), end)
+            unit_end = end if unit_end < 0 else unit_end + len(UNIT_END)
+            units.setdefault(match.group(1), (match.start(), unit_end))
+    return reference
+
+
+def find_dictionary(reference, original, text_number, chunk):
+    """
+    Return the (start, end) range of the reference file to use as dictionary
+    for a chunk: the reference units with the same IDs for a <file> chunk, the
+    text segment at the same position for text. (0, 0) means no dictionary.
+    """
+    if reference is None:
+        return 0, 0
+    if original is None:
+        texts = reference["texts"]
+        return texts[text_number] if text_number < len(texts) else (0, 0)
+    if original not in reference["files"]:
+        return 0, 0
+    file_start, file_end = reference["files"][original]
+    units = reference["units"][original]
+    ranges = [units[tu_id] for tu_id in UNIT_PATTERN.findall(chunk) if tu_id in units]
+    if ranges:
+        start = min(r[0] for r in ranges)
+        end = max(r[1] for r in ranges)
+        if chunk.startswith(b"<file"):
+            start = file_start
+    else:
+        start, end = file_start, file_end
+    return max(start, end - ZDICT_SIZE), end
+
+
+def compress_chunk(chunk, zdict):
+    """Compress a chunk with zlib, using 'zdict' as preset dictionary."""
+    compressor = zlib.compressobj(9, zdict=zdict) if zdict else zlib.compressobj(9)
+    return compressor.compress(chunk) + compressor.flush()
+
+
+def pack_file(output, content, reference_content, reference):
+    """
+    Write the chunks of a file to 'output', and return its index entry.
+    'reference' is the index of 'reference_content' (see index_reference), or
+    None to compress without dictionary.
+    """
+    segments = []
+    text_number = 0
+    for original, start, end in split_segments(content):
+        chunks = []
+        for chunk_start, chunk_end in split_chunks(content, start, end):
+            chunk = content[chunk_start:chunk_end]
+            dict_start, dict_end = find_dictionary(
+                reference, original, text_number, chunk
+            )
+            data = compress_chunk(chunk, reference_content[dict_start:dict_end])
+            chunks.append([output.tell(), len(data), dict_start, dict_end])
+            output.write(data)
+        if original is None:
+            text_number += 1
+        segments.append([original, chunks])
+    return {
+        "size": len(content),
+        "sha256": digest_content(content),
+        "segments": segments,
+    }
+
+
+def pack(base_folder, reference_locale, locales, bundle_path):
+    """
+    Write a bundle with the XLIFF files of the reference and 'locales', and
+    return (number of files, bundle size).
+    """
+    reference_folder = os.path.join(base_folder, reference_locale)
+    index = {
+        "version": FORMAT_VERSION,
+        "reference": reference_locale,
+        "locales": {},
+    }
+    references = {}
+    file_count = 0
+    # The bundle is built in memory (it is compressed), then written at once.
+    output = io.BytesIO()
+    output.write(MAGIC)
+    for locale in [reference_locale] + locales:
+        locale_folder = os.path.join(base_folder, locale)
+        files = {}
+        for xliff_path in sorted(glob(locale_folder + "/**/*.xliff", recursive=True)):
+            filename = os.path.relpath(xliff_path, locale_folder)
+            filename = filename.replace(os.sep, "/")
+            with open(xliff_path, "rb") as f:
+                content = f.read()
+            if locale == reference_locale:
+                references[filename] = (content, index_reference(content))
+                reference_content, reference = content, None
+            else:
+                reference_content, reference = references.get(filename, (b"", None))
+            files[filename] = pack_file(output, content, reference_content, reference)
+            file_count += 1
+        if files:
+            index["locales"][locale] = files
+    if not references:
+        raise ValueError(f"No reference file found in {reference_folder}")
+
+    index_data = zlib.compress(json.dumps(index).encode("utf-8"), 9)
+    index_offset = output.tell()
+    output.write(index_data)
+    output.write(FOOTER.pack(index_offset, len(index_data)))
+    content = output.getvalue()
+    write_content(content, bundle_path)
+    return file_count, len(content)
+
+
+def open_bundle(bundle_path):
+    """
+    Open a bundle and return it as a dict with 'index' (see module
+    docstring). Close it with close_bundle().
+    """
+    f = open(bundle_path, "rb")
+    try:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{bundle_path} is not a bundle")
+        f.seek(-FOOTER.size, os.SEEK_END)
+        index_offset, index_length = FOOTER.unpack(f.read(FOOTER.size))
+        f.seek(index_offset)
+        index = json.loads(zlib.decompress(f.read(index_length)))
+    except Exception:
+        f.close()
+        raise
+    if index.get("version") != FORMAT_VERSION:
+        f.close()
+        raise ValueError(f"Unsupported bundle version in {bundle_path}")
+    return {"path": bundle_path, "file": f, "index": index, "references": {}}
+
+
+def close_bundle(bundle):
+    """Close a bundle opened with open_bundle()."""
+    bundle["file"].close()
+
+
+def get_entry(bundle, locale, filename):
+    """Return the index entry of a file, or raise KeyError."""
+    try:
+        return bundle["index"]["locales"][locale][filename]
+    except KeyError:
+        raise KeyError(f"{locale}/{filename} is not in {bundle['path']}")
+
+
+def read_chunks(bundle, filename, chunks):
+    """Return the decompressed content of a list of chunks of 'filename'."""
+    content = []
+    for offset, length, dict_start, dict_end in chunks:
+        bundle["file"].seek(offset)
+        data = bundle["file"].read(length)
+        if dict_end > dict_start:
+            if filename not in bundle["references"]:
+                bundle["references"][filename] = read_file(
+                    bundle, bundle["index"]["reference"], filename
+                )
+            zdict = bundle["references"][filename][dict_start:dict_end]
+            decompressor = zlib.decompressobj(zdict=zdict)
+        else:
+            decompressor = zlib.decompressobj()
+        content.append(decompressor.decompress(data) + decompressor.flush())
+    return b"".join(content)
+
+
+def read_file(bundle, locale, filename):
+    """Return the content of a file (bytes), e.g. 'firefox-ios.xliff'."""
+    entry = get_entry(bundle, locale, filename)
+    return read_chunks(
+        bundle,
+        filename,
+        [chunk for _, chunks in entry["segments"] for chunk in chunks],
+    )
+
+
+def read_file_block(bundle, locale, filename, original):
+    """
+    Return the content of the first <file> element with this 'original' in a
+    file (bytes), or raise KeyError if there isn't one.
+    """
+    for segment_original, chunks in get_entry(bundle, locale, filename)["segments"]:
+        if segment_original == original:
+            return read_chunks(bundle, filename, chunks)
+    raise KeyError(f"No <file> element '{original}' in {locale}/{filename}")
+
+
+def parse_file_block(bundle, locale, filename, original):
+    """
+    Return the parsed <file> element with this 'original' in a file, or
+    raise KeyError if there isn't one. Only the chunks of this element, and
+    the text before the first <file> (XML declaration and root element), are
+    read.
+    """
+    block = read_file_block(bundle, locale, filename, original)
+    segments = get_entry(bundle, locale, filename)["segments"]
+    prolog = read_chunks(bundle, filename, segments[0][1])
+    root = etree.fromstring(prolog + block + b"</xliff>")
+    return root.find(FILE_TAG)
+
+
+def unpack(bundle, output_folder, locales):
+    """
+    Restore the files of 'locales' (all if empty) to 'output_folder', checking
+    their digest, and return the number of files written. Files whose path
+    isn't inside 'output_folder' (absolute, or with '..') are rejected.
+    """
+    output_folder = os.path.realpath(output_folder)
+    file_count = 0
+    for locale in locales or sorted(bundle["index"]["locales"]):
+        if locale not in bundle["index"]["locales"]:
+            print(f"WARNING: {locale} is not in the bundle")
+            continue
+        for filename, entry in sorted(bundle["index"]["locales"][locale].items()):
+            content = read_file(bundle, locale, filename)
+            if digest_content(content) != entry["sha256"]:
+                sys.exit(f"ERROR: Corrupted content for {locale}/{filename}")
+            path = os.path.realpath(
+                os.path.join(output_folder, locale, *filename.split("/"))
+            )
+            if os.path.commonpath([output_folder, path]) != output_folder:
+                sys.exit(f"ERROR: Invalid path {locale}/{filename} in the bundle")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(content)
+            file_count += 1
+    return file_count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    pack_parser = subparsers.add_parser("pack", help="Create a bundle")
+    pack_parser.add_argument(
+        "--reference",
+        required=True,
+        dest="reference_locale",
+        help="Locale code for source strings (usually en-US)",
+    )
+    pack_parser.add_argument(
+        "--path",
+        required=True,
+        dest="base_folder",
+        help="Path to folder including subfolders for all locales",
+    )
+    pack_parser.add_argument(
+        "--output", required=True, dest="bundle_path", help="Bundle file to write"
+    )
+    pack_parser.add_argument(
+        "--project",
+        required=False,
+        default=None,
+        choices=sorted(PROJECTS),
+        help="Project config to use (excluded folders). "
+        "Defaults to no excluded folders.",
+    )
+    pack_parser.add_argument(
+        "locales",
+        nargs="*",
+        help="Locales to pack (default: all locales)",
+    )
+
+    unpack_parser = subparsers.add_parser("unpack", help="Restore files")
+    unpack_parser.add_argument(
+        "--bundle", required=True, dest="bundle_path", help="Bundle file to read"
+    )
+    unpack_parser.add_argument(
+        "--output",
+        required=True,
+        dest="output_folder",
+        help="Folder to restore the locale folders to",
+    )
+    unpack_parser.add_argument(
+        "locales",
+        nargs="*",
+        help="Locales to restore (default: all locales)",
+    )
+
+    list_parser = subparsers.add_parser("list", help="List the bundle content")
+    list_parser.add_argument(
+        "--bundle", required=True, dest="bundle_path", help="Bundle file to read"
+    )
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        base_folder = os.path.realpath(args.base_folder)
+        if args.locales:
+            locales = [
+                locale for locale in args.locales if locale != args.reference_locale
+            ]
+        else:
+            config = get_project_config(args.project)
+            locales = list_locales(
+                base_folder,
+                excluded=config["excluded_folders"],
+                skip=[args.reference_locale],
+            )
+        try:
+            file_count, size = pack(
+                base_folder, args.reference_locale, locales, args.bundle_path
+            )
+        except Exception as e:
+            sys.exit(f"ERROR: Can't create {args.bundle_path}\n{e}")
+        print(f"{file_count} files packed in {args.bundle_path} ({size} bytes).")
+        return
+
+    try:
+        bundle = open_bundle(args.bundle_path)
+    except Exception as e:
+        sys.exit(f"ERROR: Can't read {args.bundle_path}\n{e}")
+    try:
+        if args.command == "unpack":
+            file_count = unpack(bundle, args.output_folder, args.locales)
+            print(f"{file_count} files restored in {args.output_folder}.")
+        else:
+            index = bundle["index"]
+            print(f"Reference: {index['reference']}")
+            for locale, files in sorted(index["locales"].items()):
+                for filename, entry in sorted(files.items()):
+                    stored = sum(
+                        chunk[1] for _, chunks in entry["segments"] for chunk in chunks
+                    )
+                    blocks = sum(
+                        1 for original, _ in entry["segments"] if original is not None
+                    )
+                    print(
+                        f"  {locale}/{filename}: {entry['size']} bytes, "
+                        f"{stored} compressed, {blocks} <file> elements"
+                    )
+    finally:
+        close_bundle(bundle)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+#! /usr/bin/env python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+check_integrity.py --reference <locale> --path <folder>
+     [--project <name>] [--json <file>] [locales...]
+
+ --project selects the excluded folders from locale_config.py. When no project
+ name is provided, empty defaults are used (no excluded folders).
+
+ Check the structure of the reference and localized XLIFF files, reporting
+ every issue found instead of stopping at the first one:
+ - 'duplicates': the same trans-unit ID more than once in a <file> block.
+ - 'missing_sources': trans-units without a <source>.
+ - 'orphaned_files': <file> blocks in a localized file that don't exist in the
+   reference (left behind by a string refactor).
+ - 'missing_units': reference trans-units missing from a localized file
+   (usually a pending Pontoon sync).
+
+ Each file is read once, and indexed as {original: Counter(ids)}. The script
+ fails if there are duplicates or missing sources; orphaned files and missing
+ units are expected between two Pontoon syncs, and only reported.
+
+ --json writes all issues to a file, as a dict with the keys above, each a
+ list of {"path", "file", "id"} objects ('path' is the XLIFF file relative to
+ the base folder, 'file' the <file> 'original' attribute; duplicates also
+ include a 'count', orphaned files have no 'id').
+"""
+
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+from glob import glob
+
+from functions import NS, list_locales
+from locale_config import PROJECTS, get_project_config
+from lxml import etree
+
+ISSUE_TYPES = ("duplicates", "missing_sources", "orphaned_files", "missing_units")
+
+
+def index_file(root, relative_path, issues):
+    """
+    Return the trans-unit IDs of a parsed XLIFF file as
+    {original: Counter(ids)}, adding duplicate IDs and units without a
+    <source> to 'issues'.
+    """
+    index = {}
+    for file_node in root.xpath("//x:file", namespaces=NS):
+        original = file_node.get("original")
+        ids = index.setdefault(original, Counter())
+        ids.update(file_node.xpath("./x:body/x:trans-unit/@id", namespaces=NS))
+        for tu_id in file_node.xpath(
+            "./x:body/x:trans-unit[not(x:source)]/@id", namespaces=NS
+        ):
+            issues["missing_sources"].append(
+                {"path": relative_path, "file": original, "id": tu_id}
+            )
+
+    for original, ids in index.items():
+        for tu_id, count in ids.items():
+            if count > 1:
+                issues["duplicates"].append(
+                    {
+                        "path": relative_path,
+                        "file": original,
+                        "id": tu_id,
+                        "count": count,
+                    }
+                )
+    return index
+
+
+def compare_to_reference(reference_index, locale_index, relative_path, issues):
+    """
+    Add to 'issues' the <file> blocks of a localized file missing from the
+    reference, and the reference units missing from the localized file.
+    """
+    for original in locale_index:
+        if original not in reference_index:
+            issues["orphaned_files"].append({"path": relative_path, "file": original})
+
+    for original, reference_ids in reference_index.items():
+        locale_ids = locale_index.get(original, {})
+        for tu_id in reference_ids:
+            if tu_id not in locale_ids:
+                issues["missing_units"].append(
+                    {"path": relative_path, "file": original, "id": tu_id}
+                )
+
+
+def check_integrity(base_folder, reference_locale, locales):
+    """
+    Check the reference files and their localized versions in 'locales', and
+    return (checked files, issues), with issues as {issue type: [entries]}.
+    """
+    issues = {issue_type: [] for issue_type in ISSUE_TYPES}
+    reference_path = os.path.join(base_folder, reference_locale)
+    reference_files = sorted(
+        os.path.relpath(xliff_path, reference_path)
+        for xliff_path in glob(reference_path + "/**/*.xliff", recursive=True)
+    )
+    if not reference_files:
+        sys.exit(f"No reference file found in {reference_path}")
+
+    checked_files = 0
+    for filename in reference_files:
+        relative_path = os.path.join(reference_locale, filename)
+        try:
+            root = etree.parse(os.path.join(base_folder, relative_path)).getroot()
+        except Exception as e:
+            sys.exit(f"ERROR: Can't parse reference file {filename}\n{e}")
+        reference_index = index_file(root, relative_path, issues)
+        checked_files += 1
+
+        for locale in locales:
+            relative_path = os.path.join(locale, filename)
+            l10n_file = os.path.join(base_folder, relative_path)
+            if not os.path.isfile(l10n_file):
+                continue
+            try:
+                root = etree.parse(l10n_file).getroot()
+            except Exception as e:
+                print(f"ERROR: Can't parse {l10n_file}")
+                print(e)
+                continue
+            locale_index = index_file(root, relative_path, issues)
+            compare_to_reference(reference_index, locale_index, relative_path, issues)
+            checked_files += 1
+
+    return checked_files, issues
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--reference",
+        required=True,
+        dest="reference_locale",
+        help="Locale code for source strings (usually en-US)",
+    )
+    parser.add_argument(
+        "--path",
+        required=True,
+        dest="base_folder",
+        help="Path to folder including subfolders for all locales",
+    )
+    parser.add_argument(
+        "--project",
+        required=False,
+        default=None,
+        choices=sorted(PROJECTS),
+        help="Project config to use (excluded folders). "
+        "Defaults to no excluded folders.",
+    )
+    parser.add_argument(
+        "--json",
+        required=False,
+        default=None,
+        dest="json_file",
+        help="Write all issues to this file in JSON format",
+    )
+    parser.add_argument(
+        "locales",
+        nargs="*",
+        help="Locales to check; if none are listed, all locale subfolders "
+        "in the path will be checked",
+    )
+    args = parser.parse_args()
+
+    base_folder = os.path.realpath(args.base_folder)
+    if args.locales:
+        locales = args.locales
+    else:
+        config = get_project_config(args.project)
+        locales = list_locales(
+            base_folder,
+            excluded=config["excluded_folders"],
+            skip={args.reference_locale},
+        )
+
+    checked_files, issues = check_integrity(base_folder, args.reference_locale, locales)
+
+    if args.json_file:
+        with open(args.json_file, "w", encoding="utf-8") as f:
+            json.dump(issues, f, indent=2, ensure_ascii=False)
+
+    for entry in issues["duplicates"]:
+        print(
+            f"ERROR: {entry['path']} ({entry['file']}): "
+            f"trans-unit '{entry['id']}' appears {entry['count']} times"
+        )
+    for entry in issues["missing_sources"]:
+        print(
+            f"ERROR: {entry['path']} ({entry['file']}): "
+            f"trans-unit '{entry['id']}' has no source"
+        )
+    for entry in issues["orphaned_files"]:
+        print(
+            f"WARNING: {entry['path']}: <file> '{entry['file']}' "
+            "is not in the reference"
+        )
+    # Missing units are reported per file, since a single new string is
+    # missing from every locale until the next Pontoon sync.
+    missing_units = Counter(entry["path"] for entry in issues["missing_units"])
+    for path, count in sorted(missing_units.items()):
+        print(f"WARNING: {path}: {count} reference trans-units missing")
+
+    if issues["duplicates"] or issues["missing_sources"]:
+        sys.exit(1)
+
+    print(f"No structural errors in {checked_files} files.")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,13 +9,16 @@ Check if Pontoon locales are missing in the repository for iOS projects.
 """
 
 import argparse
-import requests
 import sys
 from locale_config import get_locale_code, get_project_config
 from urllib.parse import quote as urlquote
 
 
 def getPontoonLocales(project_slug):
+    # Imported here rather than at module level: requests is slow to import,
+    # and not needed for --help or argument errors.
+    import requests
+
     try:
         locale_list = []
         url = f"https://pontoon.mozilla.org/api/v2/projects/{project_slug}/?fields=localizations"
@@ -45,6 +48,8 @@ def getPontoonLocales(project_slug):
 
 
 def getGithubLocales(repo, path):
+    import requests
+
     query = f"/repos/{repo}/contents/{urlquote(path)}"
     url = f"https://api.github.com{query}"
 
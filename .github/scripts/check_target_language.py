@@ -6,12 +6,22 @@
 
 """
 check_target_language.py --path <folder>
-     [--reference <locale>] [--project <name>]
+     [--reference <locale>] [--project <name>] [--since <git-ref>]
+     [--metrics-file <file>]
+check_target_language.py --bundle <bundle>
+     [--reference <locale>] [--project <name>] [--metrics-file <file>]
 
  --project selects the locale mapping and excluded folders from
  locale_config.py. When no project name is provided, empty defaults are used
  (no remapping, no excluded folders).
 
+ --since limits the check to locales with XLIFF files changed since the given
+ git reference (e.g. 'origin/main'), so a pull request only checks the
+ locales it touches.
+
+ --bundle reads the files from a bundle created by bundle.py instead of
+ --path, decompressing one file at a time.
+
  Verify that every localized XLIFF file declares the expected
  'target-language' on each <file> node. Pontoon owns this attribute, so this
  is a safety net that fails when a sync leaves a locale with the wrong (or
@@ -20,22 +30,55 @@ check_target_language.py --path <folder>
  The expected code matches the folder name, except for a few locales whose
  language code differs from their Pontoon folder (see the project 'mapping' in
  locale_config.py, selected with --project). The reference locale is skipped.
+
+ --metrics-file writes the metrics of the run (see metrics.py), in JSON or in
+ Prometheus text format ('.prom' file): files and <file> nodes checked, bytes
+ read, errors (in total and per locale), and the duration of each stage.
 """
 
 import argparse
 import os
 import sys
+import time
 from glob import glob
 
-from functions import list_locales
+from functions import get_changed_locales, list_locales
 from locale_config import PROJECTS, get_locale_code, get_project_config
-from lxml import etree
+from metrics import add_counts, new_metrics, timed_stage, write_metrics
 
 NS = {"x": "urn:oasis:names:tc:xliff:document:1.2"}
 
 
+def read_locale_files(base_folder, locale, bundle=None):
+    """
+    Yield (path, content) for the XLIFF files of a locale, read from
+    'base_folder', or from 'bundle' if set (see bundle.open_bundle). Paths of
+    files in a bundle start with the bundle path.
+    """
+    if bundle is None:
+        locale_path = os.path.join(base_folder, locale)
+        for xliff_path in glob(locale_path + "/**/*.xliff", recursive=True):
+            with open(xliff_path, "rb") as f:
+                yield xliff_path, f.read()
+        return
+
+    from bundle import read_file
+
+    for filename in sorted(bundle["index"]["locales"][locale]):
+        yield (
+            os.path.join(base_folder, locale, *filename.split("/")),
+            read_file(bundle, locale, filename),
+        )
+
+
 def check_target_languages(
-    base_folder, reference_locale="en", mapping={}, excluded_folders=()
+    base_folder,
+    reference_locale="en",
+    mapping={},
+    excluded_folders=(),
+    changed_locales=None,
+    metrics=None,
+    bundle=None,
 ):
     """
     Check every localized XLIFF file and return
@@ -47,25 +90,52 @@ def check_target_languages(
 
     'mapping' is a Pontoon-folder -> XLIFF-code dict; 'excluded_folders' lists
     non-locale folders to skip (see locale_config.get_project_config).
+    'changed_locales', if set, limits the check to those locale folders (see
+    functions.get_changed_locales). If 'metrics' is set (see metrics.py),
+    counters are added to it for each locale. If 'bundle' is set (see
+    bundle.open_bundle), files are read from it instead, and 'base_folder' is
+    the bundle path.
     """
+    from lxml import etree
+
     base_folder = os.path.realpath(base_folder)
-    locales = list_locales(
-        base_folder, excluded=excluded_folders, skip={reference_locale}
-    )
+    if bundle is None:
+        locales = list_locales(
+            base_folder, excluded=excluded_folders, skip={reference_locale}
+        )
+    else:
+        locales = [
+            locale
+            for locale in sorted(bundle["index"]["locales"])
+            if locale not in excluded_folders
+            and locale not in (reference_locale, bundle["index"]["reference"])
+        ]
+    if changed_locales is not None:
+        locales = [locale for locale in locales if locale in changed_locales]
 
     parse_errors = []
     target_errors = []
     for locale in locales:
         expected = get_locale_code(mapping, locale)
-        locale_path = os.path.join(base_folder, locale)
-        for xliff_path in glob(locale_path + "/**/*.xliff", recursive=True):
+        counts = {
+            "files_checked": 0,
+            "file_nodes_checked": 0,
+            "bytes_read": 0,
+            "parse_errors": 0,
+            "target_errors": 0,
+        }
+        for xliff_path, content in read_locale_files(base_folder, locale, bundle):
+            counts["files_checked"] += 1
+            counts["bytes_read"] += len(content)
             try:
-                root = etree.parse(xliff_path).getroot()
+                root = etree.fromstring(content)
             except Exception as e:
                 parse_errors.append(f"{xliff_path}: can't parse ({e})")
+                counts["parse_errors"] += 1
                 continue
 
             for file_node in root.xpath("//x:file", namespaces=NS):
+                counts["file_nodes_checked"] += 1
                 actual = file_node.get("target-language")
                 if actual != expected:
                     original = file_node.get("original")
@@ -73,6 +143,11 @@ def check_target_languages(
                         f"{os.path.relpath(xliff_path, base_folder)} ({original}): "
                         f"target-language is '{actual}', expected '{expected}'"
                     )
+                    counts["target_errors"] += 1
+
+        if metrics is not None:
+            add_counts(metrics["totals"], counts)
+            add_counts(metrics["locales"].setdefault(locale, {}), counts)
 
     return locales, parse_errors, target_errors
 
@@ -81,10 +156,18 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--path",
-        required=True,
+        required=False,
+        default=None,
         dest="base_folder",
         help="Path to folder including subfolders for all locales",
     )
+    parser.add_argument(
+        "--bundle",
+        required=False,
+        default=None,
+        dest="bundle_path",
+        help="Read files from this bundle (see bundle.py) instead of --path",
+    )
     parser.add_argument(
         "--reference",
         required=False,
@@ -100,15 +183,68 @@ def main():
         help="Project config to use (locale mapping + excluded folders). "
         "Defaults to no mapping and no excluded folders.",
     )
+    parser.add_argument(
+        "--since",
+        required=False,
+        default=None,
+        metavar="GIT_REF",
+        help="Only check locales with XLIFF files changed since this git reference.",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        required=False,
+        default=None,
+        metavar="FILE",
+        help="Write metrics of the run to this file, in JSON format, or in "
+        "Prometheus text format if the file name ends with '.prom'",
+    )
     args = parser.parse_args()
+    if bool(args.base_folder) == bool(args.bundle_path):
+        parser.error("Either --path or --bundle is required")
+    if args.bundle_path and args.since:
+        parser.error("--since can't be used with --bundle")
+
+    start = time.perf_counter()
+    metrics = new_metrics("check_target_language.py")
+    changed_locales = None
+    if args.since:
+        try:
+            with timed_stage(metrics, "changed_locales"):
+                changed_locales = get_changed_locales(
+                    os.path.realpath(args.base_folder), args.since
+                )
+        except Exception as e:
+            sys.exit(f"ERROR: Can't get changed files since {args.since}\n{e}")
+
+    bundle = None
+    if args.bundle_path:
+        from bundle import close_bundle, open_bundle
+
+        try:
+            bundle = open_bundle(args.bundle_path)
+        except Exception as e:
+            sys.exit(f"ERROR: Can't read {args.bundle_path}\n{e}")
 
     config = get_project_config(args.project)
-    locales, parse_errors, target_errors = check_target_languages(
-        args.base_folder,
-        args.reference_locale,
-        mapping=config["mapping"],
-        excluded_folders=config["excluded_folders"],
-    )
+    try:
+        with timed_stage(metrics, "check"):
+            locales, parse_errors, target_errors = check_target_languages(
+                args.base_folder or args.bundle_path,
+                args.reference_locale,
+                mapping=config["mapping"],
+                excluded_folders=config["excluded_folders"],
+                changed_locales=changed_locales,
+                metrics=metrics,
+                bundle=bundle,
+            )
+    finally:
+        if bundle is not None:
+            close_bundle(bundle)
+
+    if args.metrics_file:
+        metrics["totals"]["locales_checked"] = len(locales)
+        metrics["stages"]["total"] = time.perf_counter() - start
+        write_metrics(metrics, args.metrics_file)
 
     if parse_errors:
         print("Files that could not be parsed:")
@@ -0,0 +1,325 @@
+#! /usr/bin/env python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+compare_engines.py --candidate <module> [--scenarios <n>] [--seed <n>]
+     [--type standard|nofile|matchid ...] [--mode full|incremental|all]
+
+ Differential test for alternative implementations of the update logic in
+ update_other_locales.py. Any change in placement, attribute order or
+ whitespace would show up as noise diffs (and merge conflicts) in localized
+ files, so a candidate engine must produce byte-identical files.
+
+ Each scenario generates a random reference and localized file, then mutates
+ the reference the way string updates do: changed sources, strings moved to a
+ different <file>, removed and added strings, removed <file> blocks, and IDs
+ shared by several <file> blocks (like CFBundleDisplayName). Both the current
+ implementation and the candidate update the localized file for every
+ requested update type, and their serialized output is compared.
+
+ The expected output always comes from the current implementation, indenting
+ the whole tree before serializing. --mode selects how the candidate runs
+ (default: all):
+ - 'full': the same way.
+ - 'incremental': like update_other_locales.py does, with the reference
+   indented once and the digests of its <file> blocks (rebuild modes), and
+   only the elements listed in 'changed' indented again when serializing.
+   In 'standard' mode, this only applies to localized files that were
+   already indented on disk (the others are indented as a whole).
+ Use the current implementation as candidate to check its incremental path
+ against the full one ('--candidate update_other_locales --mode incremental').
+
+ The candidate is a module in this folder defining the same functions as
+ update_other_locales.py: build_reference_index(), build_file_digests(),
+ update_in_place() and rebuild_from_reference(). It can also define
+ serialize_xliff(), used instead of functions.serialize_xliff() to serialize
+ its output.
+
+ The script fails on the first difference, printing the scenario seed and a
+ diff. Otherwise it reports the time spent by each implementation and the
+ speedup.
+"""
+
+import argparse
+import difflib
+import importlib
+import io
+import random
+import sys
+import time
+from copy import deepcopy
+
+import functions
+import update_other_locales
+from lxml import etree
+from update_other_locales import NS, UPDATE_TYPES
+
+MODES = ("full", "incremental")
+XLIFF_HEADER = '<xliff xmlns="urn:oasis:names:tc:xliff:document:1.2" version="1.2">'
+# IDs reused in several <file> blocks, like iOS default keys.
+SHARED_IDS = ("CFBundleDisplayName", "CFBundleName")
+
+
+def make_unit(tu_id, source, note=None):
+    """Return a new <trans-unit> with a <source>, a copy as <target>, and a note."""
+    unit = etree.Element(f"{{{NS['x']}}}trans-unit", id=tu_id)
+    unit.set("{http://www.w3.org/XML/1998/namespace}space", "preserve")
+    etree.SubElement(unit, f"{{{NS['x']}}}source").text = source
+    etree.SubElement(unit, f"{{{NS['x']}}}target").text = source
+    if note is not None:
+        etree.SubElement(unit, f"{{{NS['x']}}}note").text = note
+    return unit
+
+
+def make_reference(rng, file_count, unit_count):
+    """Return the root of a random reference document."""
+    root = etree.fromstring(XLIFF_HEADER + "</xliff>")
+    next_id = 0
+    for file_number in range(file_count):
+        file_node = etree.SubElement(
+            root,
+            f"{{{NS['x']}}}file",
+            original=f"Module{file_number}/en.lproj/Strings{file_number}.strings",
+        )
+        file_node.set("source-language", "en-US")
+        file_node.set("target-language", "en-US")
+        file_node.set("datatype", "plaintext")
+        header = etree.SubElement(file_node, f"{{{NS['x']}}}header")
+        etree.SubElement(
+            header, f"{{{NS['x']}}}tool", {"tool-id": "com.apple.dt.xcode"}
+        )
+        body = etree.SubElement(file_node, f"{{{NS['x']}}}body")
+        for _ in range(rng.randint(1, unit_count)):
+            next_id += 1
+            body.append(
+                make_unit(
+                    f"String.{next_id}",
+                    f"Source {next_id}",
+                    note=f"Note {next_id}" if rng.random() < 0.7 else None,
+                )
+            )
+        if rng.random() < 0.5:
+            # Shared ID, with a source depending on the file.
+            tu_id = rng.choice(SHARED_IDS)
+            position = rng.randint(0, len(body))
+            body.insert(position, make_unit(tu_id, f"{tu_id} {file_number}"))
+    return root
+
+
+def make_locale(rng, reference_root, locale_code):
+    """
+    Return the root of a localized document with the reference structure,
+    a translation for most units, and target-language as last attribute of
+    each <file> (as written by Pontoon).
+    """
+    root = deepcopy(reference_root)
+    for file_node in root.xpath("//x:file", namespaces=NS):
+        del file_node.attrib["target-language"]
+        file_node.set("target-language", locale_code)
+    for unit in root.xpath("//x:trans-unit", namespaces=NS):
+        target = unit.find("x:target", namespaces=NS)
+        if rng.random() < 0.8:
+            target.text = f"[{locale_code}] {target.text}"
+        else:
+            unit.remove(target)
+    return root
+
+
+def mutate_reference(rng, root, changes):
+    """Apply 'changes' random string updates to a reference document."""
+    file_nodes = root.xpath("//x:file", namespaces=NS)
+    for change in range(changes):
+        units = root.xpath("//x:trans-unit", namespaces=NS)
+        bodies = root.xpath("//x:body", namespaces=NS)
+        if not units or not bodies:
+            return
+        action = rng.choice(("source", "move", "move_source", "remove", "add", "file"))
+        unit = rng.choice(units)
+        if action in ("source", "move_source"):
+            text = f"{unit.findtext('x:source', namespaces=NS)} (changed {change})"
+            unit.find("x:source", namespaces=NS).text = text
+            unit.find("x:target", namespaces=NS).text = text
+        if action in ("move", "move_source"):
+            destination = rng.choice(bodies)
+            unit.getparent().remove(unit)
+            destination.insert(rng.randint(0, len(destination)), unit)
+        elif action == "remove":
+            unit.getparent().remove(unit)
+        elif action == "add":
+            destination = rng.choice(bodies)
+            destination.insert(
+                rng.randint(0, len(destination)),
+                make_unit(f"New.{change}", f"New source {change}", "New note"),
+            )
+        elif action == "file" and len(file_nodes) > 1:
+            file_node = rng.choice(file_nodes)
+            file_nodes.remove(file_node)
+            root.remove(file_node)
+
+
+def to_file_content(rng, root):
+    """
+    Serialize a document like a file on disk: usually pretty-printed like the
+    files written by write_xliff() and Pontoon, sometimes without any
+    indentation. Return (content, indented).
+    """
+    if rng.random() < 0.2:
+        return etree.tostring(root, encoding="utf-8", xml_declaration=True), False
+    return functions.serialize_xliff(root).encode("utf-8"), True
+
+
+def parse(content):
+    """Parse serialized XML as etree.parse() would parse a file."""
+    return etree.parse(io.BytesIO(content))
+
+
+def run_engine(
+    engine,
+    update_type,
+    reference_content,
+    locale_content,
+    filename,
+    mode="full",
+    indented=False,
+):
+    """
+    Update a localized document with an engine, and return (serialized output,
+    seconds spent updating and serializing). Parsing isn't timed.
+
+    In 'full' mode, the engine functions are called without the incremental
+    arguments ('changed', digests), so they can keep their original
+    signatures. In 'incremental' mode, the engine gets the same arguments as
+    in update_other_locales.py (see load_reference and update_locale_tree),
+    and 'indented' tells if the localized file was indented on disk.
+    """
+    reference_tree = parse(reference_content)
+    locale_tree = parse(locale_content)
+    serialize = getattr(engine, "serialize_xliff", functions.serialize_xliff)
+    incremental = mode == "incremental"
+    start = time.perf_counter()
+    if update_type == "standard":
+        reference_index = engine.build_reference_index(
+            reference_tree.getroot(), filename
+        )
+        if incremental:
+            changed = [] if indented else None
+            engine.update_in_place(reference_index, locale_tree.getroot(), changed)
+            output = serialize(locale_tree, changed)
+        else:
+            engine.update_in_place(reference_index, locale_tree.getroot())
+            output = serialize(locale_tree)
+    elif incremental:
+        etree.indent(reference_tree)
+        reference_digests = engine.build_file_digests(reference_tree.getroot())
+        changed = []
+        new_tree = engine.rebuild_from_reference(
+            reference_tree,
+            locale_tree.getroot(),
+            update_type,
+            "fr",
+            changed,
+            reference_digests,
+        )
+        output = serialize(new_tree, changed)
+    else:
+        new_tree = engine.rebuild_from_reference(
+            reference_tree, locale_tree.getroot(), update_type, "fr"
+        )
+        output = serialize(new_tree)
+    return output, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--candidate",
+        required=True,
+        help="Module (in this folder) implementing the candidate engine",
+    )
+    parser.add_argument(
+        "--scenarios", type=int, default=200, help="Number of scenarios to run"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed of the first scenario"
+    )
+    parser.add_argument(
+        "--type",
+        action="append",
+        choices=UPDATE_TYPES,
+        dest="update_types",
+        help="Update type to compare (can be repeated, default: all)",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=MODES + ("all",),
+        default="all",
+        help="How the candidate indents its output (default: all)",
+    )
+    args = parser.parse_args()
+
+    candidate = importlib.import_module(args.candidate)
+    update_types = args.update_types or UPDATE_TYPES
+    modes = MODES if args.mode == "all" else (args.mode,)
+    filename = "test.xliff"
+
+    baseline_time = 0
+    candidate_time = 0
+    for seed in range(args.seed, args.seed + args.scenarios):
+        rng = random.Random(seed)
+        reference_root = make_reference(
+            rng, file_count=rng.randint(1, 6), unit_count=rng.randint(1, 12)
+        )
+        locale_content, indented = to_file_content(
+            rng, make_locale(rng, reference_root, "fr")
+        )
+        mutate_reference(rng, reference_root, changes=rng.randint(0, 8))
+        reference_content, _ = to_file_content(rng, reference_root)
+
+        for update_type in update_types:
+            expected, seconds = run_engine(
+                update_other_locales,
+                update_type,
+                reference_content,
+                locale_content,
+                filename,
+            )
+            baseline_time += seconds * len(modes)
+            for mode in modes:
+                actual, seconds = run_engine(
+                    candidate,
+                    update_type,
+                    reference_content,
+                    locale_content,
+                    filename,
+                    mode,
+                    indented,
+                )
+                candidate_time += seconds
+                if actual != expected:
+                    print(
+                        f"Output differs for seed {seed} in {update_type} mode "
+                        f"({mode}):"
+                    )
+                    diff = difflib.unified_diff(
+                        expected.splitlines(),
+                        actual.splitlines(),
+                        "current",
+                        args.candidate,
+                        lineterm="",
+                    )
+                    print("\n".join(list(diff)[:60]))
+                    sys.exit(1)
+
+    runs = args.scenarios * len(update_types) * len(modes)
+    print(f"{runs} runs identical ({args.scenarios} scenarios).")
+    print(f"Current implementation: {baseline_time:.3f}s")
+    print(f"{args.candidate}: {candidate_time:.3f}s")
+    if candidate_time:
+        print(f"Speedup: {baseline_time / candidate_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
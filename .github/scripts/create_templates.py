@@ -6,19 +6,27 @@
 
 """
 create_templates.py --reference <ref_folder> --output <template_folder>
+     [--metrics-file <file>]
 
  Generate the source-only template used by Pontoon from the reference locale.
  For each reference XLIFF file, the tree is copied, all <target> elements are
  removed, and the 'target-language' attribute is dropped from every <file>
  node.
+
+ --metrics-file writes the metrics of the run (see metrics.py), in JSON or in
+ Prometheus text format ('.prom' file): files processed and modified, units
+ scanned, targets removed, bytes read and written, and the duration of each
+ stage.
 """
 
 from functions import write_xliff
 from glob import glob
 from lxml import etree
+from metrics import add_counts, new_metrics, timed_stage, write_metrics
 import argparse
 import os
 import sys
+import time
 
 
 NS = {"x": "urn:oasis:names:tc:xliff:document:1.2"}
@@ -38,8 +46,19 @@ def main():
         dest="output_path",
         help="Path to the template folder",
     )
+    parser.add_argument(
+        "--metrics-file",
+        required=False,
+        default=None,
+        metavar="FILE",
+        help="Write metrics of the run to this file, in JSON format, or in "
+        "Prometheus text format if the file name ends with '.prom'",
+    )
     args = parser.parse_args()
 
+    start = time.perf_counter()
+    metrics = new_metrics("create_templates.py")
+
     reference_path = os.path.realpath(args.reference_path)
     output_path = os.path.realpath(args.output_path)
 
@@ -49,26 +68,50 @@ def main():
     reference_files.sort()
 
     for file_path in reference_files:
-        try:
-            tree = etree.parse(file_path)
-            root = tree.getroot()
-        except Exception as e:
-            sys.exit(f"ERROR: Can't parse reference file {file_path}\n{e}")
-
-        # Drop the target-language attribute from each <file> node.
-        for file_node in root.xpath("//x:file", namespaces=NS):
-            file_node.attrib.pop("target-language", None)
-
-        # Remove all translations.
-        for target in root.xpath("//x:target", namespaces=NS):
-            target.getparent().remove(target)
+        with timed_stage(metrics, "parse"):
+            try:
+                tree = etree.parse(file_path)
+                root = tree.getroot()
+            except Exception as e:
+                sys.exit(f"ERROR: Can't parse reference file {file_path}\n{e}")
+
+        with timed_stage(metrics, "transform"):
+            # Drop the target-language attribute from each <file> node.
+            for file_node in root.xpath("//x:file", namespaces=NS):
+                file_node.attrib.pop("target-language", None)
+
+            # Remove all translations.
+            targets = root.xpath("//x:target", namespaces=NS)
+            for target in targets:
+                target.getparent().remove(target)
 
         # Write the template mirroring the reference file paths.
         relative_path = os.path.relpath(file_path, reference_path)
         template_file = os.path.join(output_path, relative_path)
-        os.makedirs(os.path.dirname(template_file), exist_ok=True)
-        write_xliff(tree, template_file)
+        with timed_stage(metrics, "write"):
+            previous_content = None
+            if args.metrics_file and os.path.isfile(template_file):
+                with open(template_file, "rb") as f:
+                    previous_content = f.read()
+            os.makedirs(os.path.dirname(template_file), exist_ok=True)
+            content = write_xliff(tree, template_file)
         print(f"Created template {template_file}")
+        if args.metrics_file:
+            add_counts(
+                metrics["totals"],
+                {
+                    "files_processed": 1,
+                    "files_modified": int(content != previous_content),
+                    "units_scanned": len(root.xpath("//x:trans-unit", namespaces=NS)),
+                    "targets_removed": len(targets),
+                    "bytes_read": os.path.getsize(file_path),
+                    "bytes_written": len(content),
+                },
+            )
+
+    if args.metrics_file:
+        metrics["stages"]["total"] = time.perf_counter() - start
+        write_metrics(metrics, args.metrics_file)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,367 @@
+#! /usr/bin/env python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+export_sqlite.py export --reference <locale> --path <folder> --db <file>
+     [--project <name>] [--jobs <n>]
+export_sqlite.py query --db <file> (--id <trans-unit id> | --search <text>)
+     [--locale <locale>...] [--limit <n>]
+
+ 'export' loads the reference and every localized XLIFF file into a SQLite
+ database, to answer questions like "how is this string translated across
+ locales" without grepping every file. Files are parsed in parallel and
+ inserted in batches, in a single transaction. Each XLIFF file's digest is
+ stored, so running the export again on an existing database only reloads the
+ files that changed (and drops the ones that were removed).
+
+ Tables:
+ - locales (locale, is_reference)
+ - documents (id, locale, path, digest): one row per XLIFF file.
+ - files (id, document_id, original, target_language): <file> blocks.
+ - units (id, file_id, unit_id, position, source): <trans-unit> elements.
+ - targets (unit_id, text, state), notes (unit_id, text): 'unit_id' here is
+   units.id, not the trans-unit ID.
+ - unit_text: FTS5 index over units.source and targets.text, with the same
+   rowid as units.
+
+ 'query' prints the translations of a trans-unit ID in every locale (--id), or
+ the units whose source or translation match an FTS5 query (--search).
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+from glob import glob
+
+from functions import NS, digest_file, list_locales
+from locale_config import PROJECTS, get_project_config
+from lxml import etree
+from scheduler import schedule_tasks
+
+SCHEMA = """
+PRAGMA foreign_keys = ON;
+CREATE TABLE IF NOT EXISTS locales (
+    locale TEXT PRIMARY KEY,
+    is_reference INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    locale TEXT NOT NULL REFERENCES locales(locale) ON DELETE CASCADE,
+    path TEXT NOT NULL UNIQUE,
+    digest TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    original TEXT NOT NULL,
+    target_language TEXT
+);
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    unit_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS units_unit_id ON units(unit_id);
+CREATE INDEX IF NOT EXISTS units_file_id ON units(file_id);
+CREATE INDEX IF NOT EXISTS files_document_id ON files(document_id);
+CREATE TABLE IF NOT EXISTS targets (
+    unit_id INTEGER PRIMARY KEY REFERENCES units(id) ON DELETE CASCADE,
+    text TEXT,
+    state TEXT
+);
+CREATE TABLE IF NOT EXISTS notes (
+    unit_id INTEGER NOT NULL REFERENCES units(id) ON DELETE CASCADE,
+    text TEXT
+);
+CREATE INDEX IF NOT EXISTS notes_unit_id ON notes(unit_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS unit_text USING fts5(source, target);
+"""
+
+
+def extract_units(task):
+    """
+    Parse one XLIFF file and return its content as plain data:
+    {"path", "files": [(original, target_language, units)]}, with units as
+    (id, source, target, state, notes) tuples ('target' and 'state' are None
+    for untranslated units). If the file can't be parsed, return
+    {"path", "error"} instead. Used as the scheduler worker, so it can run in
+    a separate process.
+    """
+    try:
+        root = etree.parse(task["full_path"]).getroot()
+    except Exception as e:
+        return {"path": task["path"], "error": str(e)}
+    files = []
+    for file_node in root.xpath("//x:file", namespaces=NS):
+        units = []
+        for trans_node in file_node.xpath(".//x:trans-unit", namespaces=NS):
+            target = trans_node.find("x:target", namespaces=NS)
+            units.append(
+                (
+                    trans_node.get("id"),
+                    trans_node.findtext("x:source", namespaces=NS),
+                    target.text if target is not None else None,
+                    target.get("state") if target is not None else None,
+                    [n.text for n in trans_node.findall("x:note", namespaces=NS)],
+                )
+            )
+        files.append(
+            (file_node.get("original"), file_node.get("target-language"), units)
+        )
+    return {"path": task["path"], "files": files}
+
+
+def delete_document(cursor, document_id):
+    """Remove a document, its content and its full-text entries."""
+    cursor.execute(
+        """
+        DELETE FROM unit_text WHERE rowid IN (
+            SELECT units.id FROM units JOIN files ON units.file_id = files.id
+            WHERE files.document_id = ?
+        )
+        """,
+        (document_id,),
+    )
+    cursor.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+
+
+def next_id(cursor, table):
+    """Return the first unused ID in a table."""
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}")
+    return cursor.fetchone()[0]
+
+
+def insert_document(cursor, document_id, content):
+    """
+    Insert the extracted content of a document in batches. IDs are assigned
+    here (instead of relying on lastrowid for each row), so every table can be
+    filled with a single executemany().
+    """
+    file_rows = []
+    unit_rows = []
+    target_rows = []
+    note_rows = []
+    text_rows = []
+    file_id = next_id(cursor, "files")
+    unit_id = next_id(cursor, "units")
+    for original, target_language, units in content["files"]:
+        file_rows.append((file_id, document_id, original, target_language))
+        for position, (tu_id, source, target, state, notes) in enumerate(units):
+            unit_rows.append((unit_id, file_id, tu_id, position, source))
+            if target is not None:
+                target_rows.append((unit_id, target, state))
+            note_rows.extend((unit_id, note) for note in notes)
+            text_rows.append((unit_id, source, target))
+            unit_id += 1
+        file_id += 1
+
+    cursor.executemany("INSERT INTO files VALUES (?, ?, ?, ?)", file_rows)
+    cursor.executemany("INSERT INTO units VALUES (?, ?, ?, ?, ?)", unit_rows)
+    cursor.executemany("INSERT INTO targets VALUES (?, ?, ?)", target_rows)
+    cursor.executemany("INSERT INTO notes VALUES (?, ?)", note_rows)
+    cursor.executemany(
+        "INSERT INTO unit_text (rowid, source, target) VALUES (?, ?, ?)", text_rows
+    )
+
+
+def export(db_path, base_folder, reference_locale, locales, jobs):
+    """
+    Load (or refresh) the XLIFF files of the reference and 'locales' into the
+    database at 'db_path'. Return (loaded, unchanged, failed, removed) file
+    counts, 'failed' being the files that couldn't be parsed.
+    """
+    documents = {}
+    for locale in [reference_locale] + locales:
+        locale_path = os.path.join(base_folder, locale)
+        for xliff_path in glob(locale_path + "/**/*.xliff", recursive=True):
+            documents[os.path.relpath(xliff_path, base_folder)] = locale
+
+    connection = sqlite3.connect(db_path)
+    cursor = connection.cursor()
+    cursor.executescript(SCHEMA)
+    cursor.execute("SELECT path, id, digest FROM documents")
+    stored = {path: (document_id, digest) for path, document_id, digest in cursor}
+
+    tasks = []
+    digests = {}
+    for path in sorted(documents):
+        full_path = os.path.join(base_folder, path)
+        digests[path] = digest_file(full_path)
+        if path in stored and stored[path][1] == digests[path]:
+            continue
+        tasks.append(
+            {
+                "path": path,
+                "full_path": full_path,
+                "cost": os.path.getsize(full_path),
+            }
+        )
+
+    with connection:
+        removed = [path for path in stored if path not in documents]
+        for path in removed:
+            delete_document(cursor, stored[path][0])
+
+        cursor.executemany(
+            "INSERT OR IGNORE INTO locales VALUES (?, ?)",
+            [
+                (locale, locale == reference_locale)
+                for locale in [reference_locale] + locales
+            ],
+        )
+
+        loaded = 0
+        failed = 0
+        for content in schedule_tasks(tasks, extract_units, jobs):
+            path = content["path"]
+            if "error" in content:
+                # Keep the previous content (if any) of a broken file.
+                print(f"ERROR: Can't parse {path}")
+                print(content["error"])
+                failed += 1
+                continue
+            if path in stored:
+                delete_document(cursor, stored[path][0])
+            cursor.execute(
+                "INSERT INTO documents (locale, path, digest) VALUES (?, ?, ?)",
+                (documents[path], path, digests[path]),
+            )
+            insert_document(cursor, cursor.lastrowid, content)
+            loaded += 1
+
+    connection.close()
+    return loaded, len(documents) - len(tasks), failed, len(removed)
+
+
+def query(db_path, unit_id=None, search=None, locales=(), limit=50):
+    """
+    Return (locale, original, trans-unit ID, source, target) rows for a
+    trans-unit ID, or for units whose text matches an FTS5 query.
+    """
+    if not os.path.isfile(db_path):
+        sys.exit(f"Database not found: {db_path}")
+
+    connection = sqlite3.connect(db_path)
+    sql = """
+        SELECT documents.locale, files.original, units.unit_id, units.source,
+            targets.text
+        FROM units
+        JOIN files ON units.file_id = files.id
+        JOIN documents ON files.document_id = documents.id
+        LEFT JOIN targets ON targets.unit_id = units.id
+    """
+    conditions = []
+    params = []
+    if unit_id is not None:
+        conditions.append("units.unit_id = ?")
+        params.append(unit_id)
+    if search is not None:
+        conditions.append(
+            "units.id IN (SELECT rowid FROM unit_text WHERE unit_text MATCH ?)"
+        )
+        params.append(search)
+    if locales:
+        conditions.append(f"documents.locale IN ({', '.join('?' for _ in locales)})")
+        params.extend(locales)
+    sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY documents.locale, files.original, units.position LIMIT ?"
+    params.append(limit)
+    try:
+        rows = connection.execute(sql, params).fetchall()
+    except sqlite3.OperationalError as e:
+        sys.exit(f"ERROR: Invalid query\n{e}")
+    connection.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser(
+        "export", help="Load or refresh the XLIFF files in the database"
+    )
+    export_parser.add_argument(
+        "--reference",
+        required=True,
+        dest="reference_locale",
+        help="Locale code for source strings (usually en-US)",
+    )
+    export_parser.add_argument(
+        "--path",
+        required=True,
+        dest="base_folder",
+        help="Path to folder including subfolders for all locales",
+    )
+    export_parser.add_argument(
+        "--db", required=True, dest="db_path", help="Path to the SQLite database"
+    )
+    export_parser.add_argument(
+        "--project",
+        required=False,
+        default=None,
+        choices=sorted(PROJECTS),
+        help="Project config to use (excluded folders). "
+        "Defaults to no excluded folders.",
+    )
+    export_parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes used to parse files "
+        "(default: number of CPUs)",
+    )
+
+    query_parser = subparsers.add_parser("query", help="Query the database")
+    query_parser.add_argument(
+        "--db", required=True, dest="db_path", help="Path to the SQLite database"
+    )
+    group = query_parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--id", dest="unit_id", help="Trans-unit ID to look up")
+    group.add_argument("--search", help="FTS5 query over source and translated text")
+    query_parser.add_argument(
+        "--locale",
+        action="append",
+        default=[],
+        dest="locales",
+        help="Only show results for this locale (can be repeated)",
+    )
+    query_parser.add_argument(
+        "--limit", type=int, default=50, help="Maximum number of results"
+    )
+    args = parser.parse_args()
+
+    if args.command == "export":
+        base_folder = os.path.realpath(args.base_folder)
+        config = get_project_config(args.project)
+        locales = list_locales(
+            base_folder,
+            excluded=config["excluded_folders"],
+            skip={args.reference_locale},
+        )
+        loaded, unchanged, failed, removed = export(
+            args.db_path, base_folder, args.reference_locale, locales, args.jobs
+        )
+        print(
+            f"{loaded} files loaded, {unchanged} unchanged, {removed} removed "
+            f"in {args.db_path}."
+        )
+        if failed:
+            print(f"{failed} files couldn't be parsed (previous content kept).")
+    else:
+        rows = query(args.db_path, args.unit_id, args.search, args.locales, args.limit)
+        for locale, original, tu_id, source, target in rows:
+            print(f"{locale} ({original}) {tu_id}")
+            print(f"  source: {source}")
+            print(f"  target: {target if target is not None else '(untranslated)'}")
+        print(f"{len(rows)} results.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+#! /usr/bin/env python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+export_strings.py --reference <locale> --path <folder> --output <folder>
+     [--project <name>] [--jobs <n>] [locales...]
+
+ Convert the localized XLIFF files into the .strings files used by the iOS
+ app, without the Xcode import (LocalizationTools) on a macOS runner. Useful
+ to check and stage translations on Linux.
+
+ Each <file> block is written following its 'original' path, relative to the
+ output folder, with the .lproj folder replaced by the locale's: with the
+ 'ios' project, 'Client/en.lproj/InfoPlist.strings' in 'ga-IE' is written to
+ 'Client/ga.lproj/InfoPlist.strings' (see the mapping in locale_config.py).
+ Strings from an .intentdefinition file go to a .strings file with the same
+ name, as Xcode does.
+
+ Only translated strings are exported, in the XLIFF order, with their note
+ as comment. An output file is only written if its content changed, so
+ unchanged files keep their timestamp. Files no longer in the XLIFF are not
+ removed.
+
+ .stringsdict blocks are skipped with a warning: XLIFF only stores the
+ translated values of plural rules, not the format keys needed to rebuild
+ the property list.
+
+ Locales are exported in parallel (--jobs, one task per locale).
+"""
+
+import argparse
+import os
+import sys
+from glob import glob
+
+from functions import NS, list_locales, scan_file_nodes
+from locale_config import PROJECTS, get_locale_code, get_project_config
+from lxml import etree
+from scheduler import schedule_tasks
+
+
+def get_output_path(original, locale_code):
+    """
+    Return the path of the .strings file for a <file> block, relative to the
+    output folder, or None if the block can't be exported.
+    """
+    parts = original.split("/")
+    if original.startswith("/") or ".." in parts:
+        return None
+    lproj_folders = [i for i, part in enumerate(parts[:-1]) if part.endswith(".lproj")]
+    if not lproj_folders:
+        return None
+    parts[lproj_folders[-1]] = f"{locale_code}.lproj"
+    name, extension = os.path.splitext(parts[-1])
+    if extension == ".stringsdict":
+        return None
+    parts[-1] = f"{name}.strings"
+    return os.path.join(*parts)
+
+
+def escape_string(text):
+    """Escape text for a double-quoted string in a .strings file."""
+    return (
+        text.replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+        .replace("\t", "\\t")
+    )
+
+
+def format_entry(string_id, translation, note):
+    """Return a .strings entry, with the note as comment (like Xcode)."""
+    if note is None:
+        note = "No comment provided by engineer."
+    # A comment can't contain its own end marker.
+    comment = note.replace("*/", "* /")
+    return (
+        f"/* {comment} */\n"
+        f'"{escape_string(string_id)}" = "{escape_string(translation or "")}";\n'
+    )
+
+
+def export_locale(task):
+    """
+    Convert the XLIFF files of a locale, and write the .strings files that
+    changed. Return {"locale", "written", "unchanged", "errors"}. Used as the
+    scheduler worker, so it can run in a separate process.
+    """
+    result = {"locale": task["locale"], "written": 0, "unchanged": 0, "errors": []}
+    # {output path: [entries]}, in the XLIFF order.
+    outputs = {}
+    for xliff_path in task["xliff_paths"]:
+        try:
+            root = etree.parse(xliff_path).getroot()
+        except Exception as e:
+            result["errors"].append(f"Can't parse {xliff_path}\n{e}")
+            continue
+        for file_node, units in scan_file_nodes(root):
+            original = file_node.get("original", "")
+            output_path = get_output_path(original, task["locale_code"])
+            if output_path is None:
+                print(f"WARNING: Skipping {original} in {xliff_path}")
+                continue
+            entries = outputs.setdefault(output_path, [])
+            for trans_node, _, target in units:
+                if target is None:
+                    continue
+                entries.append(
+                    format_entry(
+                        trans_node.get("id"),
+                        target.text,
+                        trans_node.findtext("x:note", namespaces=NS),
+                    )
+                )
+
+    for output_path, entries in sorted(outputs.items()):
+        if not entries:
+            continue
+        content = "\n".join(entries).encode("utf-8")
+        full_path = os.path.join(task["output_folder"], output_path)
+        try:
+            with open(full_path, "rb") as f:
+                if f.read() == content:
+                    result["unchanged"] += 1
+                    continue
+        except FileNotFoundError:
+            pass
+        try:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "wb") as f:
+                f.write(content)
+        except Exception as e:
+            result["errors"].append(f"Can't write {full_path}\n{e}")
+            continue
+        result["written"] += 1
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--reference",
+        required=True,
+        dest="reference_locale",
+        help="Reference locale code (not exported)",
+    )
+    parser.add_argument(
+        "--path",
+        required=True,
+        dest="base_folder",
+        help="Path to folder including subfolders for all locales",
+    )
+    parser.add_argument(
+        "--output",
+        required=True,
+        dest="output_folder",
+        help="Folder where .strings files are written (e.g. the app checkout)",
+    )
+    parser.add_argument(
+        "--project",
+        required=False,
+        default=None,
+        choices=sorted(PROJECTS),
+        help="Project config to use (locale mapping, excluded folders). "
+        "Defaults to no remapping and no excluded folders.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "locales",
+        nargs="*",
+        help="Locales to export (default: all locales except the reference)",
+    )
+    args = parser.parse_args()
+
+    config = get_project_config(args.project)
+    mapping = config["mapping"]
+    base_folder = os.path.realpath(args.base_folder)
+    output_folder = os.path.realpath(args.output_folder)
+
+    if args.locales:
+        locales = args.locales
+    else:
+        locales = list_locales(
+            base_folder,
+            excluded=config["excluded_folders"],
+            skip=[args.reference_locale],
+        )
+
+    tasks = []
+    for locale in locales:
+        locale_folder = os.path.join(base_folder, locale)
+        if not os.path.isdir(locale_folder):
+            sys.exit(f"ERROR: Folder not found for locale '{locale}'")
+        xliff_paths = sorted(glob(locale_folder + "/**/*.xliff", recursive=True))
+        if not xliff_paths:
+            continue
+        tasks.append(
+            {
+                "locale": locale,
+                "locale_code": get_locale_code(mapping, locale),
+                "xliff_paths": xliff_paths,
+                "output_folder": output_folder,
+                "cost": sum(os.path.getsize(path) for path in xliff_paths),
+            }
+        )
+
+    written = 0
+    unchanged = 0
+    errors = []
+    for result in schedule_tasks(tasks, export_locale, args.jobs):
+        written += result["written"]
+        unchanged += result["unchanged"]
+        errors.extend(result["errors"])
+
+    print(f"{written} files written, {unchanged} unchanged ({len(tasks)} locales).")
+    if errors:
+        for error in errors:
+            print(f"ERROR: {error}")
+        sys.exit(f"{len(errors)} errors while exporting.")
+
+
+if __name__ == "__main__":
+    main()
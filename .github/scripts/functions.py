@@ -3,31 +3,189 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import hashlib
 import os
+import re
+import shutil
 
-from lxml import etree
+NS = {"x": "urn:oasis:names:tc:xliff:document:1.2"}
+FILE_TAG = f"{{{NS['x']}}}file"
+TRANS_UNIT_TAG = f"{{{NS['x']}}}trans-unit"
+SOURCE_TAG = f"{{{NS['x']}}}source"
+TARGET_TAG = f"{{{NS['x']}}}target"
+FILE_START_PATTERN = re.compile(rb"<file[\s>]")
+FILE_END = b"</file>"
 
 
-def write_xliff(root, filename):
-    with open(filename, "w+") as fp:
-        # Fix indentation of XML file
+def scan_file_nodes(root):
+    """
+    Return [(file_node, units)] for every <file> in the tree, where 'units'
+    lists [trans_node, source node, target node] for every <trans-unit> in the
+    block (None for a missing <source> or <target>).
+
+    A single walk over the few tags involved is much faster than looking up
+    each unit's children with find().
+    """
+    files = []
+    units = None
+    unit = None
+    for node in root.iter(FILE_TAG, TRANS_UNIT_TAG, SOURCE_TAG, TARGET_TAG):
+        tag = node.tag
+        if tag == FILE_TAG:
+            units = []
+            files.append((node, units))
+            unit = None
+        elif tag == TRANS_UNIT_TAG:
+            unit = [node, None, None]
+            if units is not None:
+                units.append(unit)
+        elif unit is not None and node.getparent() is unit[0]:
+            # Only direct children, like find() (not e.g. inside <alt-trans>).
+            index = 1 if tag == SOURCE_TAG else 2
+            if unit[index] is None:
+                unit[index] = node
+    return files
+
+
+def split_segments(content, root=None):
+    """
+    Split an XLIFF document into segments [(original, start, end)] covering
+    it entirely: one per <file> element, and the text around them (None as
+    'original'). If <file> elements can't be located reliably in the raw
+    content (comments, CDATA, prefixed tags), the whole document is a single
+    text segment. 'root' avoids parsing the content again if it's available.
+    """
+    whole = [(None, 0, len(content))]
+    if root is None:
+        from lxml import etree
+
+        try:
+            root = etree.fromstring(content)
+        except Exception:
+            return whole
+    originals = [file_node.get("original") for file_node in root.iter(FILE_TAG)]
+    if b"<!--" in content or b"<![CDATA[" in content:
+        return whole
+    if content.count(FILE_END) != len(originals):
+        return whole
+
+    segments = []
+    position = 0
+    for original in originals:
+        match = FILE_START_PATTERN.search(content, position)
+        if match is None:
+            return whole
+        end = content.find(FILE_END, match.start())
+        if end < 0:
+            return whole
+        end += len(FILE_END)
+        if match.start() > position:
+            segments.append((None, position, match.start()))
+        segments.append((original, match.start(), end))
+        position = end
+    if FILE_START_PATTERN.search(content, position) is not None:
+        return whole
+    segments.append((None, position, len(content)))
+    return segments
+
+
+def indent_changed(changed):
+    """
+    Indent only the elements in 'changed' (and their descendants), at their
+    depth in the tree, leaving the whitespace of the rest of the tree as is.
+    """
+    from lxml import etree
+
+    for element in changed:
+        depth = sum(1 for _ in element.iterancestors())
+        etree.indent(element, level=depth)
+
+
+def indent_xliff(root, changed=None):
+    """
+    Indent an XLIFF tree like Pontoon does. By default the whole tree is
+    indented. If the tree is known to be already indented (e.g. built from an
+    indented reference), 'changed' can list the elements whose children were
+    added or removed since then: only those are indented again, with the same
+    result as indenting the whole tree.
+    """
+    if changed is None:
+        from lxml import etree
+
         etree.indent(root)
-        """
-        Hack to avoid conflicts with Pontoon, which uses single quotes
-        for the XML declaration:
-            1. Exclude the XML declaration when using etree.tostring()
-            2. Manually add the declaration with double quotes
-        """
-        xliff_content = etree.tostring(
-            root,
-            encoding="UTF-8",
-            xml_declaration=False,
-            pretty_print=True,
-        )
-        xliff_content = (
-            '<?xml version="1.0" encoding="utf-8"?>\n' + xliff_content.decode("utf-8")
-        )
-        fp.write(xliff_content)
+    else:
+        indent_changed(changed)
+
+
+def serialize_xliff(root, changed=None):
+    """
+    Return the content of an XLIFF file as a string, with the same
+    indentation and XML declaration as the files written by Pontoon (see
+    indent_xliff for 'changed').
+    """
+    from lxml import etree
+
+    # Fix indentation of XML file
+    indent_xliff(root, changed)
+    """
+    Hack to avoid conflicts with Pontoon, which uses single quotes
+    for the XML declaration:
+        1. Exclude the XML declaration when using etree.tostring()
+        2. Manually add the declaration with double quotes
+    """
+    xliff_content = etree.tostring(
+        root,
+        encoding="UTF-8",
+        xml_declaration=False,
+        pretty_print=True,
+    )
+    return '<?xml version="1.0" encoding="utf-8"?>\n' + xliff_content.decode("utf-8")
+
+
+def digest_content(content):
+    """Return the SHA-256 digest of bytes, in hexadecimal."""
+    return hashlib.sha256(content).hexdigest()
+
+
+def digest_file(path):
+    """Return the SHA-256 digest of a file's content, in hexadecimal."""
+    with open(path, "rb") as f:
+        return digest_content(f.read())
+
+
+def write_content(content, filename, fsync=False):
+    """
+    Write 'content' (bytes) to 'filename'. With 'fsync', wait until the
+    content is on disk before returning.
+
+    The content is written to a temporary file in the same folder, then moved
+    over 'filename': an interrupted write never leaves a truncated file. An
+    existing file keeps its permissions.
+    """
+    temp_filename = f"{filename}.{os.getpid()}.tmp"
+    try:
+        with open(temp_filename, "wb") as fp:
+            fp.write(content)
+            if fsync:
+                fp.flush()
+                os.fsync(fp.fileno())
+        if os.path.exists(filename):
+            shutil.copymode(filename, temp_filename)
+        os.replace(temp_filename, filename)
+    finally:
+        # Only left if the write or the replace failed.
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+
+
+def write_xliff(root, filename, fsync=False, changed=None):
+    """
+    Write an XLIFF tree to 'filename' (see serialize_xliff for 'changed', and
+    write_content for 'fsync'), and return the content written (bytes).
+    """
+    xliff_content = serialize_xliff(root, changed).encode("utf-8")
+    write_content(xliff_content, filename, fsync)
+    return xliff_content
 
 
 def list_locales(base_folder, excluded=(), skip=()):
@@ -46,3 +204,41 @@ def list_locales(base_folder, excluded=(), skip=()):
         and d not in excluded
         and d not in skip
     )
+
+
+def get_changed_locales(base_folder, since):
+    """
+    Return the set of locale folder names in base_folder with at least one
+    XLIFF file changed since the git reference `since` (e.g. 'origin/main'),
+    including uncommitted changes. Paths are read with a single
+    `git diff --name-only` call, relative to base_folder.
+
+    Raise an exception if git fails (e.g. unknown reference).
+    """
+    import subprocess
+
+    output = subprocess.run(
+        [
+            "git",
+            "diff",
+            "--name-only",
+            "--no-renames",
+            "--relative",
+            "-z",
+            since,
+            "--",
+            "*.xliff",
+        ],
+        cwd=base_folder,
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+    ).stdout
+
+    changed = set()
+    for path in output.split("\0"):
+        # Only files inside a locale folder count, not top-level files.
+        parts = path.split("/", 1)
+        if len(parts) == 2:
+            changed.add(parts[0])
+    return changed
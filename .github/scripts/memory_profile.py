@@ -0,0 +1,252 @@
+#! /usr/bin/env python3
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Memory profile of a script run, recorded with --memory-profile.
+
+Each step of processing a file is a phase (e.g. parse, index, rebuild,
+carry-over, indent, serialize), recorded with:
+ - 'allocated': peak of the Python allocations during the phase, above what
+   was already allocated when it started (tracemalloc).
+ - 'retained': Python allocations still held at the end of the phase.
+ - 'rss': resident set size of the process at the end of the phase, and
+   'rss_growth': how much it grew during the phase (both 0 where the current
+   RSS isn't available, i.e. without /proc/self/statm).
+ - 'top': the source lines that allocated the most during the phase, from
+   tracemalloc snapshots taken before and after it. Snapshots are slow, so
+   they're only taken for some files (see memory_phase).
+
+tracemalloc only sees memory allocated by Python: lxml trees are allocated
+by libxml2, and only show in the RSS values.
+
+The profile is a dict with 'script', 'phases' ({phase: values}) and 'locales'
+({locale: {phase: values}}, without 'top'), each value being the largest one
+recorded for that phase (and locale), and 'peak_rss': the peak RSS of the
+whole run (see record_peak_rss). The operating system only reports the peak
+over the lifetime of a process, so it's not recorded per phase.
+
+It's written as JSON, and can be kept as a baseline for later runs: phases
+whose allocations or RSS growth, or a peak RSS that grew beyond a threshold
+compared to the baseline are reported (see compare_profiles). Compare runs
+made with the same options, since RSS depends on the number of processes.
+"""
+
+import json
+import os
+import sys
+from contextlib import contextmanager
+
+from functions import write_content
+
+# Values compared against the baseline.
+COMPARED_KEYS = ("allocated", "rss_growth")
+# Growth ignored when comparing against the baseline, whatever the threshold.
+MIN_GROWTH = 256 * 1024
+# Number of source lines listed in 'top'.
+TOP_COUNT = 5
+
+
+def new_profile(script):
+    """Return an empty memory profile for 'script'."""
+    return {
+        "script": script,
+        "phases": {},
+        "locales": {},
+        "peak_rss": 0,
+    }
+
+
+def get_rss():
+    """Return the current RSS of the process in bytes, or 0 if unknown."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return 0
+    return pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def get_peak_rss():
+    """
+    Return the peak RSS of the current process, or of its largest finished
+    child process (workers), in bytes, or 0 if unknown.
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak_rss = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    # Bytes on macOS, kilobytes elsewhere.
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+def take_snapshot(tracemalloc):
+    """Take a tracemalloc snapshot, ignoring the allocations of tracemalloc."""
+    return tracemalloc.take_snapshot().filter_traces(
+        (tracemalloc.Filter(False, tracemalloc.__file__),)
+    )
+
+
+def top_allocations(before, after):
+    """
+    Return the source lines that allocated the most between two snapshots,
+    as [["file:line", bytes]].
+    """
+    top = []
+    for stat in after.compare_to(before, "lineno")[:TOP_COUNT]:
+        if stat.size_diff <= 0:
+            break
+        frame = stat.traceback[0]
+        top.append(
+            [f"{os.path.basename(frame.filename)}:{frame.lineno}", stat.size_diff]
+        )
+    return top
+
+
+def merge_phase(phases, phase, values):
+    """
+    Merge the values recorded for a phase into 'phases' ({phase: values}),
+    keeping the largest of each value, and the 'top' list of the largest
+    allocation that has one.
+    """
+    current = phases.get(phase)
+    if current is None:
+        phases[phase] = dict(values)
+        return
+    if "top" in values and (
+        "top" not in current or values["allocated"] > current["allocated"]
+    ):
+        current["top"] = values["top"]
+    for key, value in values.items():
+        if key != "top":
+            current[key] = max(current[key], value)
+
+
+@contextmanager
+def memory_phase(stats, phase):
+    """
+    Record the memory used by the 'with' block as 'phase' in stats["memory"]
+    ({phase: values}). Does nothing if 'stats' is None or has no 'memory' key,
+    i.e. when profiling isn't enabled. 'top' is only recorded if
+    stats["memory_snapshots"] is set. Phases can't be nested.
+    """
+    if stats is None or "memory" not in stats:
+        yield
+        return
+
+    import tracemalloc
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    snapshots = stats.get("memory_snapshots", False)
+    before = take_snapshot(tracemalloc) if snapshots else None
+    start_size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    start_rss = get_rss()
+    try:
+        yield
+    finally:
+        size, peak = tracemalloc.get_traced_memory()
+        rss = get_rss()
+        values = {
+            "allocated": max(peak - start_size, 0),
+            "retained": size - start_size,
+            "rss": rss,
+            "rss_growth": max(rss - start_rss, 0),
+        }
+        if snapshots:
+            values["top"] = top_allocations(before, take_snapshot(tracemalloc))
+        merge_phase(stats["memory"], phase, values)
+
+
+def add_phases(profile, locale, phases):
+    """Add the phases recorded for a file of 'locale' to the profile."""
+    locale_phases = profile["locales"].setdefault(locale, {})
+    for phase, values in phases.items():
+        merge_phase(profile["phases"], phase, values)
+        merge_phase(
+            locale_phases,
+            phase,
+            {key: value for key, value in values.items() if key != "top"},
+        )
+
+
+def record_peak_rss(profile):
+    """Record the peak RSS of the run so far (see get_peak_rss)."""
+    profile["peak_rss"] = get_peak_rss()
+
+
+def write_profile(profile, path):
+    """Write a profile to 'path' as JSON, replacing the file atomically."""
+    content = json.dumps(profile, indent=2, sort_keys=True) + "\n"
+    write_content(content.encode("utf-8"), path)
+
+
+def load_profile(path):
+    """Return a profile written by write_profile()."""
+    with open(path, encoding="utf-8") as f:
+        profile = json.load(f)
+    if not isinstance(profile, dict) or "phases" not in profile:
+        raise ValueError(f"{path} is not a memory profile")
+    profile.setdefault("locales", {})
+    profile.setdefault("peak_rss", 0)
+    return profile
+
+
+def compare_profiles(profile, baseline, threshold):
+    """
+    Return the phases whose values grew by more than 'threshold' percent
+    compared to 'baseline', as a list of (scope, phase, key, baseline value,
+    value), 'scope' being 'all' for the whole run, or a locale. The peak RSS
+    of the run is reported as phase 'run'. Phases missing from the baseline,
+    and growths under MIN_GROWTH bytes, are ignored.
+    """
+    scopes = [("all", baseline["phases"], profile["phases"])]
+    for locale, phases in sorted(profile["locales"].items()):
+        scopes.append((locale, baseline["locales"].get(locale, {}), phases))
+
+    regressions = []
+    for scope, baseline_phases, phases in scopes:
+        for phase, values in phases.items():
+            baseline_values = baseline_phases.get(phase)
+            if baseline_values is None:
+                continue
+            for key in COMPARED_KEYS:
+                baseline_value = baseline_values.get(key, 0)
+                growth = values[key] - baseline_value
+                if growth > MIN_GROWTH and growth * 100 > baseline_value * threshold:
+                    regressions.append((scope, phase, key, baseline_value, values[key]))
+
+    baseline_value = baseline["peak_rss"]
+    growth = profile["peak_rss"] - baseline_value
+    if (
+        baseline_value
+        and growth > MIN_GROWTH
+        and growth * 100 > baseline_value * threshold
+    ):
+        regressions.append(
+            ("all", "run", "peak_rss", baseline_value, profile["peak_rss"])
+        )
+    return regressions
+
+
+def format_size(size):
+    """Format a number of bytes in MB."""
+    return f"{size / 1024 / 1024:.1f} MB"
+
+
+def print_profile(profile):
+    """Print the values recorded for each phase of the whole run."""
+    print("Memory profile (largest values per phase):")
+    for phase, values in profile["phases"].items():
+        print(
+            f"  {phase}: {format_size(values['allocated'])} allocated, "
+            f"{format_size(values['retained'])} retained, "
+            f"RSS grew by {format_size(values['rss_growth'])}"
+        )
+    print(f"Peak RSS of the run: {format_size(profile['peak_rss'])}")
@@ -9,6 +9,8 @@ import argparse
 import sys
 from pathlib import Path
 
+from functions import NS
+
 
 def merge_section(section_name, source_section, target_section):
     """
@@ -56,6 +58,53 @@ def merge_json(source_data, target_data):
     return target_data
 
 
+def build_reference_index(reference_path):
+    """
+    Return the set of "<file>:<id>" strings for all trans-units in the XLIFF
+    files of the reference folder, with <file> relative to that folder (the
+    format used by exclusions).
+    """
+    from lxml import etree
+
+    index = set()
+    for xliff_path in sorted(reference_path.glob("**/*.xliff")):
+        relative_path = xliff_path.relative_to(reference_path).as_posix()
+        try:
+            root = etree.parse(str(xliff_path))
+        except Exception as e:
+            print(f"Error parsing XLIFF file {xliff_path}: {e}")
+            sys.exit(1)
+        for tu_id in root.xpath("//x:trans-unit/@id", namespaces=NS):
+            index.add(f"{relative_path}:{tu_id}")
+    return index
+
+
+def prune_exclusions(data, reference_index, prune=False):
+    """
+    Report exclusions pointing to strings that are not in reference_index
+    (see build_reference_index), and remove them if prune is True.
+
+    Return the number of stale exclusions.
+    """
+    stale_count = 0
+    for section_name, section in data.items():
+        exclusions = section.get("exclusions")
+        if not exclusions:
+            continue
+        stale = [item for item in exclusions if item not in reference_index]
+        for item in stale:
+            action = "Removing" if prune else "Note:"
+            print(
+                f"{action} exclusion '{item}' in section '{section_name}': string not available in reference."
+            )
+        if prune and stale:
+            section["exclusions"] = [
+                item for item in exclusions if item in reference_index
+            ]
+        stale_count += len(stale)
+    return stale_count
+
+
 def load_json_file(path):
     try:
         with open(path, "r", encoding="utf-8") as f:
@@ -80,8 +129,23 @@ def main():
     )
     parser.add_argument("--source", help="Path to the source JSON file")
     parser.add_argument("--target", help="Path to the target JSON file")
+    parser.add_argument(
+        "--reference",
+        required=False,
+        default=None,
+        help="Path to the reference locale folder (e.g. en-US), to report "
+        "exclusions for strings that don't exist anymore",
+    )
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="Remove exclusions for strings missing from --reference",
+    )
     args = parser.parse_args()
 
+    if args.prune and not args.reference:
+        sys.exit("ERROR: --prune requires --reference")
+
     source_path = Path(args.source)
     target_path = Path(args.target)
 
@@ -90,6 +154,10 @@ def main():
 
     merged_data = merge_json(source_data, target_data)
 
+    if args.reference:
+        reference_index = build_reference_index(Path(args.reference))
+        prune_exclusions(merged_data, reference_index, args.prune)
+
     # Save the merged data back to the target file.
     save_json_file(target_path, merged_data)
 
@@ -0,0 +1,445 @@
+#! /usr/bin/env python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+merge_xliff.py <base> <ours> <theirs> [<path>]
+
+ Git merge driver for XLIFF files, merging trans-units instead of lines. To
+ enable it in a clone (the .gitattributes file already maps *.xliff to it):
+
+   git config merge.xliff.name "XLIFF merge driver"
+   git config merge.xliff.driver "python3 .github/scripts/merge_xliff.py %O %A %B %P"
+
+ Each version is indexed as {(original, id): unit}, where a unit is compared
+ through its attributes and the tag, attributes and text of its children
+ (<source>, <target>, <note>), ignoring whitespace. For each unit:
+ - Same content in ours and theirs, or unchanged in theirs: keep ours.
+ - Unchanged in ours: take theirs (including additions and removals).
+ - Changed in both in different ways: conflict.
+
+ Units added by theirs are inserted after the closest preceding unit of the
+ same <file>, and <file> blocks added by theirs after the closest preceding
+ <file>. The rest of the document is merged the same way, each as a whole:
+ - The attributes of <xliff>, and of each <file> (e.g. target-language).
+ - The other children of each <file> (e.g. <header> with the <tool> and its
+   build-num), compared with their descendants, ignoring whitespace.
+ The result is written to <ours> with the same format as Pontoon.
+
+ With conflicts, each one is listed, and the script exits with 1 so that git
+ marks the file as conflicted. Both versions of each conflicting part (unit,
+ start tag for attributes, or <file> children) are written between standard
+ conflict markers, with an empty side for a removed part:
+
+   <<<<<<< ours
+         <trans-unit id="..."> ... (ours)
+   =======
+         <trans-unit id="..."> ... (theirs)
+   >>>>>>> theirs
+
+ The file can't be parsed until every conflict is resolved by hand. Files
+ that can't be parsed, or with duplicated IDs, fall back to 'git merge-file'
+ (line-based merge with conflict markers).
+"""
+
+import re
+import subprocess
+import sys
+from copy import deepcopy
+
+from functions import (
+    FILE_TAG,
+    NS,
+    TRANS_UNIT_TAG,
+    serialize_xliff,
+    write_content,
+    write_xliff,
+)
+from lxml import etree
+
+BODY_TAG = f"{{{NS['x']}}}body"
+# Comments marking each conflict in the merged trees, replaced by conflict
+# markers once serialized (see add_conflict_markers): the start and end of a
+# block of elements, or a start tag (the line before the comment).
+CONFLICT_START = "merge-conflict-{}"
+CONFLICT_END = "merge-conflict-{}-end"
+CONFLICT_TAG = "merge-conflict-{}-tag"
+CONFLICT_PATTERN = re.compile(
+    r"^[ \t]*<!--merge-conflict-(\d+)-->\n(.*?)^[ \t]*<!--merge-conflict-\1-end-->\n"
+    r"|^([^\n]*\n)[ \t]*<!--merge-conflict-(\d+)-tag-->\n",
+    re.MULTILINE | re.DOTALL,
+)
+
+
+def unit_digest(unit):
+    """
+    Return a hashable value representing the content of a trans-unit,
+    ignoring whitespace between elements.
+    """
+    return (
+        tuple(sorted(unit.attrib.items())),
+        tuple(
+            (child.tag, tuple(sorted(child.attrib.items())), child.text)
+            for child in unit
+        ),
+    )
+
+
+def element_digest(node):
+    """
+    Return a hashable value representing an element with its descendants,
+    ignoring whitespace around text and between elements.
+    """
+    return (
+        node.tag,
+        tuple(sorted(node.attrib.items())),
+        (node.text or "").strip(),
+        tuple(element_digest(child) for child in node),
+    )
+
+
+def file_extras(file_node):
+    """Return the children of a <file> element other than <body>."""
+    return [child for child in file_node if child.tag != BODY_TAG]
+
+
+def index_tree(root):
+    """
+    Index a parsed XLIFF file as (files, units): files as {original: node},
+    units as {(original, id): (node, digest)}, both in document order.
+
+    Raise ValueError if a trans-unit ID is duplicated in a <file>.
+    """
+    files = {}
+    units = {}
+    for file_node in root.iter(FILE_TAG):
+        original = file_node.get("original")
+        files[original] = file_node
+        for unit in file_node.iter(TRANS_UNIT_TAG):
+            key = (original, unit.get("id"))
+            if key in units:
+                raise ValueError(f"Duplicated ID {key[1]} in {original}")
+            units[key] = (unit, unit_digest(unit))
+    return files, units
+
+
+def merge_value(base, ours, theirs):
+    """
+    Return (value, conflict) for a 3-way merge of two versions of a value
+    (None if missing). In case of conflict, the value from ours is returned.
+    """
+    if ours == theirs or theirs == base:
+        return ours, False
+    if ours == base:
+        return theirs, False
+    return ours, True
+
+
+def describe_conflict(base, ours, theirs):
+    """Return a short description of a conflict between two versions."""
+    if ours is None:
+        return "removed in ours, changed in theirs"
+    if theirs is None:
+        return "changed in ours, removed in theirs"
+    if base is None:
+        return "added in both"
+    return "changed in both"
+
+
+def insert_file(our_root, our_files, their_files, original):
+    """
+    Add an empty copy of the <file> 'original' from theirs to ours, after the
+    closest preceding <file> existing in ours, and return it.
+    """
+    their_file = their_files[original]
+    new_file = deepcopy(their_file)
+    body = new_file.find(BODY_TAG)
+    if body is not None:
+        for unit in list(body.iter(TRANS_UNIT_TAG)):
+            unit.getparent().remove(unit)
+    else:
+        body = etree.SubElement(new_file, BODY_TAG)
+
+    originals = list(their_files)
+    for previous in reversed(originals[: originals.index(original)]):
+        if previous in our_files:
+            our_files[previous].addnext(new_file)
+            break
+    else:
+        first_file = next(our_root.iter(FILE_TAG), None)
+        if first_file is not None:
+            first_file.addprevious(new_file)
+        else:
+            our_root.append(new_file)
+    our_files[original] = new_file
+    return new_file
+
+
+def mark_block(first, last, index):
+    """
+    Add the comments delimiting conflict 'index' around the elements from
+    'first' to 'last' (siblings), or just before 'first' if 'last' is None
+    (no element on this side).
+    """
+    first.addprevious(etree.Comment(CONFLICT_START.format(index)))
+    end = etree.Comment(CONFLICT_END.format(index))
+    if last is None:
+        first.addprevious(end)
+    else:
+        last.addnext(end)
+
+
+def mark_start_tag(node, index):
+    """Add the comment marking the start tag of a node for conflict 'index'."""
+    node.insert(0, etree.Comment(CONFLICT_TAG.format(index)))
+
+
+def mark_extras(file_node, index):
+    """Mark the children of a <file> other than <body> for conflict 'index'."""
+    extras = file_extras(file_node)
+    if extras:
+        mark_block(extras[0], extras[-1], index)
+    else:
+        mark_block(file_node.find(BODY_TAG), None, index)
+
+
+def merge_attributes(base_node, our_node, their_node):
+    """
+    Merge the attributes of two versions of a node into 'our_node', and
+    return True in case of conflict ('our_node' is left unchanged).
+    """
+    base_attrib = dict(base_node.attrib) if base_node is not None else None
+    value, conflict = merge_value(
+        base_attrib, dict(our_node.attrib), dict(their_node.attrib)
+    )
+    if not conflict and value != dict(our_node.attrib):
+        our_node.attrib.clear()
+        our_node.attrib.update(value)
+    return conflict
+
+
+def merge_extras(base_file, our_file, their_file):
+    """
+    Merge the children other than <body> of two versions of a <file> into
+    'our_file', and return True in case of conflict ('our_file' is left
+    unchanged).
+    """
+    base = (
+        [element_digest(node) for node in file_extras(base_file)]
+        if base_file is not None
+        else None
+    )
+    ours = [element_digest(node) for node in file_extras(our_file)]
+    theirs = [element_digest(node) for node in file_extras(their_file)]
+    value, conflict = merge_value(base, ours, theirs)
+    if not conflict and value != ours:
+        for node in file_extras(our_file):
+            our_file.remove(node)
+        body = our_file.find(BODY_TAG)
+        for node in file_extras(their_file):
+            body.addprevious(deepcopy(node))
+    return conflict
+
+
+def merge_trees(base_root, our_root, their_root):
+    """
+    Merge the changes from theirs into ours (modified in place), and return
+    the list of conflicts as (original, id, description) tuples. 'id' is None
+    for conflicts outside of units, and 'original' too for conflicts on the
+    <xliff> element.
+
+    Each conflict is delimited by comments in both trees (see mark_block and
+    mark_start_tag), around the version of ours and theirs, if any.
+    """
+    base_files, base_units = index_tree(base_root)
+    our_files, our_units = index_tree(our_root)
+    their_files, their_units = index_tree(their_root)
+    conflicts = []
+    # Marks of conflicts outside of units, as (function, our node, their
+    # node), indexed like 'conflicts'.
+    marks = {}
+
+    if merge_attributes(base_root, our_root, their_root):
+        marks[len(conflicts)] = (mark_start_tag, our_root, their_root)
+        conflicts.append((None, None, "<xliff> attributes changed in both"))
+
+    # <file> elements existing on both sides: attributes, and children other
+    # than <body>.
+    for original, our_file in our_files.items():
+        their_file = their_files.get(original)
+        if their_file is None:
+            continue
+        base_file = base_files.get(original)
+        if merge_attributes(base_file, our_file, their_file):
+            marks[len(conflicts)] = (mark_start_tag, our_file, their_file)
+            conflicts.append((original, None, "attributes changed in both"))
+        if merge_extras(base_file, our_file, their_file):
+            marks[len(conflicts)] = (mark_extras, our_file, their_file)
+            conflicts.append(
+                (original, None, "elements outside <body> changed in both")
+            )
+
+    # Units: changes and removals are applied directly, additions from theirs
+    # are inserted in their order, once all other units are in place.
+    merged = {key: node for key, (node, _) in our_units.items()}
+    additions = []
+    for key in list(our_units) + [k for k in their_units if k not in our_units]:
+        base = base_units[key][1] if key in base_units else None
+        ours = our_units[key][1] if key in our_units else None
+        theirs = their_units[key][1] if key in their_units else None
+        value, conflict = merge_value(base, ours, theirs)
+        if conflict:
+            conflicts.append((*key, describe_conflict(base, ours, theirs)))
+            if ours is None:
+                # Inserted like an addition, to find where the conflict goes.
+                additions.append(key)
+            continue
+        if value == ours:
+            continue
+        if theirs is None:
+            node = merged.pop(key)
+            node.getparent().remove(node)
+        elif ours is None:
+            additions.append(key)
+        else:
+            node = deepcopy(their_units[key][0])
+            merged[key].getparent().replace(merged[key], node)
+            merged[key] = node
+
+    their_order = {}
+    for original, tu_id in their_units:
+        their_order.setdefault(original, []).append(tu_id)
+    for original, tu_id in additions:
+        node = deepcopy(their_units[(original, tu_id)][0])
+        ids = their_order[original]
+        for previous in reversed(ids[: ids.index(tu_id)]):
+            if (original, previous) in merged:
+                merged[(original, previous)].addnext(node)
+                break
+        else:
+            file_node = our_files.get(original)
+            if file_node is None:
+                file_node = insert_file(our_root, our_files, their_files, original)
+            body = file_node.find(BODY_TAG)
+            if body is None:
+                body = etree.SubElement(file_node, BODY_TAG)
+            body.insert(0, node)
+        merged[(original, tu_id)] = node
+
+    for index, (original, tu_id, description) in enumerate(conflicts):
+        if index in marks:
+            mark, our_node, their_node = marks[index]
+            mark(our_node, index)
+            mark(their_node, index)
+            continue
+        key = (original, tu_id)
+        node = merged[key]
+        mark_block(node, node, index)
+        if key not in our_units:
+            # Removed in ours: only the comments are left.
+            merged.pop(key)
+            node.getparent().remove(node)
+        if key in their_units:
+            node = their_units[key][0]
+            mark_block(node, node, index)
+
+    # Remove <file> elements left empty, if theirs removed them.
+    for original, file_node in our_files.items():
+        if (
+            original not in their_files
+            and original in base_files
+            and next(file_node.iter(TRANS_UNIT_TAG), None) is None
+        ):
+            file_node.getparent().remove(file_node)
+
+    return conflicts
+
+
+def conflict_block(match):
+    """Return (index, lines) for a conflict found with CONFLICT_PATTERN."""
+    if match.group(1) is not None:
+        return match.group(1), match.group(2)
+    return match.group(4), match.group(3)
+
+
+def add_conflict_markers(our_content, their_content):
+    """
+    Return the serialized merged file (ours) with the comments delimiting each
+    conflict replaced by conflict markers, around the lines of ours and the
+    lines delimited by the same comments in the serialized file of theirs.
+    """
+    their_blocks = dict(
+        conflict_block(match) for match in CONFLICT_PATTERN.finditer(their_content)
+    )
+
+    def replace(match):
+        index, block = conflict_block(match)
+        return (
+            f"<<<<<<< ours\n{block}=======\n"
+            f"{their_blocks.get(index, '')}>>>>>>> theirs\n"
+        )
+
+    return CONFLICT_PATTERN.sub(replace, our_content)
+
+
+def merge_lines(base_file, our_file, their_file):
+    """Fall back to a line-based merge, and return git's exit code."""
+    return subprocess.run(
+        ["git", "merge-file", "-L", "ours", "-L", "base", "-L", "theirs"]
+        + [our_file, base_file, their_file]
+    ).returncode
+
+
+def main():
+    if len(sys.argv) not in (4, 5):
+        sys.exit(__doc__.strip().splitlines()[0])
+    base_file, our_file, their_file = sys.argv[1:4]
+    path = sys.argv[4] if len(sys.argv) == 5 else our_file
+
+    contents = []
+    for filename in (base_file, our_file, their_file):
+        with open(filename, "rb") as f:
+            contents.append(f.read())
+    base_content, our_content, their_content = contents
+
+    # Changes only on one side: no need to parse anything.
+    if their_content in (base_content, our_content):
+        sys.exit(0)
+    if our_content == base_content:
+        with open(our_file, "wb") as f:
+            f.write(their_content)
+        sys.exit(0)
+
+    try:
+        base_root, our_root, their_root = (
+            etree.fromstring(content) if content else etree.Element("xliff")
+            for content in contents
+        )
+        conflicts = merge_trees(base_root, our_root, their_root)
+    except Exception as e:
+        print(f"WARNING: Can't merge {path} by unit, using a line-based merge")
+        print(e)
+        sys.exit(1 if merge_lines(base_file, our_file, their_file) else 0)
+
+    if not conflicts:
+        write_xliff(our_root, our_file)
+    else:
+        content = add_conflict_markers(
+            serialize_xliff(our_root), serialize_xliff(their_root)
+        )
+        write_content(content.encode("utf-8"), our_file)
+        print(f"CONFLICT: {len(conflicts)} conflicts in {path}")
+        for original, tu_id, description in conflicts:
+            if tu_id is not None:
+                print(f"  {original} ({tu_id}): {description}")
+            elif original is not None:
+                print(f"  {original}: {description}")
+            else:
+                print(f"  {description}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#! /usr/bin/env python3
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Machine-readable metrics of a script run, written with --metrics-file.
+
+Metrics are a dict with:
+ - 'script' and 'timestamp' (Unix time of the end of the run).
+ - 'stages': {stage: duration in seconds}.
+ - 'totals': {counter: value} for the whole run.
+ - 'locales': {locale: {counter: value}}.
+
+The file is written as JSON, or in the Prometheus text format if its name
+ends with '.prom' (e.g. for the textfile collector of node_exporter), with
+one 'l10n_<counter>' metric per total, one 'l10n_locale_<counter>' metric
+per locale counter, and 'l10n_stage_duration_seconds' for stages.
+"""
+
+import json
+import time
+from contextlib import contextmanager
+
+from functions import write_content
+
+
+def new_metrics(script):
+    """Return an empty metrics dict for 'script'."""
+    return {
+        "script": script,
+        "timestamp": None,
+        "stages": {},
+        "totals": {},
+        "locales": {},
+    }
+
+
+@contextmanager
+def timed_stage(metrics, stage):
+    """Add the time spent in the 'with' block to a stage duration."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        metrics["stages"][stage] = metrics["stages"].get(stage, 0) + duration
+
+
+def add_counts(counters, values):
+    """Add 'values' ({counter: number}) to a dict of counters."""
+    for key, value in values.items():
+        counters[key] = counters.get(key, 0) + value
+
+
+def format_label(value):
+    """Escape a Prometheus label value."""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value):
+    """Format a sample value (counters are integers, durations floats)."""
+    if isinstance(value, float):
+        return f"{value:.6f}"
+    return str(int(value))
+
+
+def format_prometheus(metrics):
+    """Return metrics in the Prometheus text exposition format."""
+    script = f'script="{format_label(metrics["script"])}"'
+    lines = [
+        "# TYPE l10n_last_run_timestamp_seconds gauge",
+        f"l10n_last_run_timestamp_seconds{{{script}}} {metrics['timestamp']}",
+        "# TYPE l10n_stage_duration_seconds gauge",
+    ]
+    for stage, duration in sorted(metrics["stages"].items()):
+        lines.append(
+            f'l10n_stage_duration_seconds{{{script},stage="{format_label(stage)}"}} '
+            f"{format_value(duration)}"
+        )
+    for key, value in sorted(metrics["totals"].items()):
+        lines.append(f"# TYPE l10n_{key} gauge")
+        lines.append(f"l10n_{key}{{{script}}} {format_value(value)}")
+
+    locale_keys = sorted(
+        {key for counts in metrics["locales"].values() for key in counts}
+    )
+    for key in locale_keys:
+        lines.append(f"# TYPE l10n_locale_{key} gauge")
+        for locale, counts in sorted(metrics["locales"].items()):
+            if key in counts:
+                lines.append(
+                    f'l10n_locale_{key}{{{script},locale="{format_label(locale)}"}} '
+                    f"{format_value(counts[key])}"
+                )
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(metrics, path):
+    """
+    Write metrics to 'path' (see module docstring for the format). The file is
+    replaced atomically, so a collector never reads a partial file.
+    """
+    metrics["timestamp"] = round(time.time(), 3)
+    if path.endswith(".prom"):
+        content = format_prometheus(metrics)
+    else:
+        content = json.dumps(metrics, indent=2, sort_keys=True) + "\n"
+    write_content(content.encode("utf-8"), path)
@@ -0,0 +1,291 @@
+#! /usr/bin/env python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+multilocale.py --reference <locale> --path <folder> [--file <name>]
+     [--project <name>] [locales...]
+multilocale.py --bundle <bundle> [--file <name>] [locales...]
+
+ In-memory model of a reference XLIFF file and its translations in many
+ locales, for tools looking at all locales at once.
+
+ Keeping one lxml tree per locale means about 100 copies of every <source> and
+ <note>. Here the reference units are stored once, as (original, id, source,
+ note) tuples with interned IDs. Each locale only stores:
+ - 'targets': its translations, aligned to the reference units (None for
+   untranslated strings, or for a translation of an outdated source).
+ - 'extra': {(original, id): (source, target)} for the units that don't match
+   a reference unit: strings removed from the reference (Pontoon removes them
+   on next sync), or whose source changed since they were translated.
+
+ Files are read with iterparse(), discarding each unit once read, so a full
+ document is never held in memory.
+
+ Run as a script, it loads every locale and prints its completion. With
+ --bundle, files are read from a bundle created by bundle.py instead.
+"""
+
+import argparse
+import io
+import os
+import sys
+
+from functions import (
+    FILE_TAG,
+    NS,
+    SOURCE_TAG,
+    TARGET_TAG,
+    TRANS_UNIT_TAG,
+    list_locales,
+)
+from locale_config import PROJECTS, get_project_config
+from lxml import etree
+
+NOTE_TAG = f"{{{NS['x']}}}note"
+
+
+def iter_units(path):
+    """
+    Yield (original, id, source, target, note) for every <trans-unit> of an
+    XLIFF file ('target' and 'note' are None if missing).
+    """
+    original = None
+    for event, node in etree.iterparse(
+        path, events=("start", "end"), tag=(FILE_TAG, TRANS_UNIT_TAG)
+    ):
+        if node.tag == FILE_TAG:
+            if event == "start":
+                original = node.get("original")
+            continue
+        if event == "start":
+            continue
+
+        source = target = note = None
+        for child in node:
+            if child.tag == SOURCE_TAG and source is None:
+                source = child.text
+            elif child.tag == TARGET_TAG and target is None:
+                target = child.text or ""
+            elif child.tag == NOTE_TAG and note is None:
+                note = child.text
+        yield original, node.get("id"), source, target, note
+
+        # Discard the units already read.
+        node.clear()
+        while node.getprevious() is not None:
+            del node.getparent()[0]
+
+
+def load_reference(path):
+    """
+    Load a reference file (path or file object) as {"path", "units",
+    "positions"}: 'units' is a tuple of (original, id, source, note),
+    'positions' maps (original, id) to the position of the unit. For a
+    duplicated ID, the first unit wins.
+    """
+    units = []
+    positions = {}
+    for original, tu_id, source, _, note in iter_units(path):
+        key = (sys.intern(original or ""), sys.intern(tu_id or ""))
+        if key in positions:
+            continue
+        positions[key] = len(units)
+        units.append((key[0], key[1], source, note))
+    return {"path": path, "units": tuple(units), "positions": positions}
+
+
+def load_locale(reference, path):
+    """
+    Load a localized file (path or file object) as {"path", "targets",
+    "extra"}, aligned to a reference loaded with load_reference() (see module
+    docstring).
+    """
+    units = reference["units"]
+    positions = reference["positions"]
+    targets = [None] * len(units)
+    extra = {}
+    for original, tu_id, source, target, _ in iter_units(path):
+        key = (original or "", tu_id or "")
+        position = positions.get(key)
+        if position is not None and units[position][2] == source:
+            if targets[position] is None:
+                targets[position] = target
+        elif position is None or target is not None:
+            extra[(sys.intern(key[0]), sys.intern(key[1]))] = (source, target)
+    return {"path": path, "targets": tuple(targets), "extra": extra}
+
+
+def load_locales(reference, base_folder, filename, locales):
+    """
+    Return {locale: data} for the locales with a localized 'filename' (see
+    load_locale). Files that can't be parsed are reported and skipped.
+    """
+    data = {}
+    for locale in locales:
+        path = os.path.join(base_folder, locale, filename)
+        if not os.path.isfile(path):
+            continue
+        try:
+            data[locale] = load_locale(reference, path)
+        except Exception as e:
+            print(f"ERROR: Can't parse {path}")
+            print(e)
+    return data
+
+
+def get_translation(reference, locale_data, original, tu_id):
+    """
+    Return the translation of a reference unit in a locale, or None if it's
+    not translated (or not in the reference).
+    """
+    position = reference["positions"].get((original, tu_id))
+    if position is None:
+        return None
+    return locale_data["targets"][position]
+
+
+def iter_translations(reference, locale_data):
+    """Yield (original, id, source, target) for every reference unit."""
+    for (original, tu_id, source, _), target in zip(
+        reference["units"], locale_data["targets"]
+    ):
+        yield original, tu_id, source, target
+
+
+def load_folder(args):
+    """
+    Return (reference locale, reference, {locale: data}) for the files in
+    --path.
+    """
+    base_folder = os.path.realpath(args.base_folder)
+    reference_path = os.path.join(base_folder, args.reference_locale, args.filename)
+    try:
+        reference = load_reference(reference_path)
+    except Exception as e:
+        sys.exit(f"ERROR: Can't parse reference file {reference_path}\n{e}")
+
+    if args.locales:
+        locales = args.locales
+    else:
+        config = get_project_config(args.project)
+        locales = list_locales(
+            base_folder,
+            excluded=config["excluded_folders"],
+            skip=[args.reference_locale],
+        )
+    data = load_locales(reference, base_folder, args.filename, locales)
+    return args.reference_locale, reference, data
+
+
+def load_bundle(args):
+    """
+    Return (reference locale, reference, {locale: data}) for the files in
+    --bundle. Only the requested files are decompressed.
+    """
+    from bundle import close_bundle, open_bundle, read_file
+
+    try:
+        bundle = open_bundle(args.bundle_path)
+    except Exception as e:
+        sys.exit(f"ERROR: Can't read {args.bundle_path}\n{e}")
+    try:
+        index = bundle["index"]
+        reference_locale = args.reference_locale or index["reference"]
+        try:
+            reference = load_reference(
+                io.BytesIO(read_file(bundle, reference_locale, args.filename))
+            )
+        except Exception as e:
+            sys.exit(f"ERROR: Can't load reference file from bundle\n{e}")
+        data = {}
+        config = get_project_config(args.project)
+        excluded = set(config["excluded_folders"]) | {reference_locale}
+        locales = args.locales or [
+            locale for locale in sorted(index["locales"]) if locale not in excluded
+        ]
+        for locale in locales:
+            if args.filename not in index["locales"].get(locale, {}):
+                continue
+            try:
+                content = read_file(bundle, locale, args.filename)
+                data[locale] = load_locale(reference, io.BytesIO(content))
+            except Exception as e:
+                print(f"ERROR: Can't load {locale}/{args.filename} from bundle")
+                print(e)
+        return reference_locale, reference, data
+    finally:
+        close_bundle(bundle)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--reference",
+        required=False,
+        default=None,
+        dest="reference_locale",
+        help="Locale code for source strings (usually en-US, default with "
+        "--bundle: the bundle reference)",
+    )
+    parser.add_argument(
+        "--path",
+        required=False,
+        default=None,
+        dest="base_folder",
+        help="Path to folder including subfolders for all locales",
+    )
+    parser.add_argument(
+        "--bundle",
+        required=False,
+        default=None,
+        dest="bundle_path",
+        help="Read files from this bundle (see bundle.py) instead of --path",
+    )
+    parser.add_argument(
+        "--file",
+        required=False,
+        default="firefox-ios.xliff",
+        dest="filename",
+        help="XLIFF file to load, relative to the locale folder "
+        "(default: firefox-ios.xliff)",
+    )
+    parser.add_argument(
+        "--project",
+        required=False,
+        default=None,
+        choices=sorted(PROJECTS),
+        help="Project config to use (excluded folders). "
+        "Defaults to no excluded folders.",
+    )
+    parser.add_argument(
+        "locales",
+        nargs="*",
+        help="Locales to load (default: all locales except the reference)",
+    )
+    args = parser.parse_args()
+    if bool(args.base_folder) == bool(args.bundle_path):
+        parser.error("Either --path or --bundle is required")
+
+    if args.bundle_path:
+        reference_locale, reference, data = load_bundle(args)
+    else:
+        if args.reference_locale is None:
+            parser.error("--reference is required with --path")
+        reference_locale, reference, data = load_folder(args)
+
+    total = len(reference["units"])
+    print(f"{total} strings in {reference_locale}, {len(data)} locales loaded.")
+    for locale, locale_data in sorted(data.items()):
+        translated = sum(target is not None for target in locale_data["targets"])
+        completion = translated / total if total else 0
+        print(
+            f"  {locale}: {translated} translated ({completion:.1%}), "
+            f"{len(locale_data['extra'])} extra units"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#! /usr/bin/env python3
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Pipelined execution of per-file work in a single process.
+
+Each task goes through three stages: read (e.g. parse a file), transform
+(update the parsed tree) and write (serialize and save it). Instead of running
+them in strict sequence, a reader thread prefetches the next tasks and a
+writer thread saves the previous ones while the current one is transformed,
+with bounded queues between stages to cap the number of trees held in memory.
+lxml releases the GIL while parsing and serializing, so disk access overlaps
+with computation even without a process pool.
+"""
+
+import queue
+import threading
+
+# Number of items that can wait between two stages.
+QUEUE_SIZE = 2
+
+# Marks the end of the tasks in a queue.
+_DONE = object()
+
+
+def _read_stage(tasks, read, read_queue):
+    for task in tasks:
+        try:
+            read_queue.put((task, read(task), None))
+        except Exception as e:
+            # Forwarded to the main thread, which raises it.
+            read_queue.put((task, None, e))
+            return
+    read_queue.put(_DONE)
+
+
+def _write_stage(write, write_queue, errors):
+    while True:
+        item = write_queue.get()
+        if item is _DONE:
+            return
+        if errors:
+            # Drain the queue after a failure, so the main thread isn't blocked.
+            continue
+        task, output = item
+        try:
+            write(task, output)
+        except Exception as e:
+            errors.append(e)
+
+
+def run_pipeline(tasks, read, transform, write, queue_size=QUEUE_SIZE):
+    """
+    For every task, in order, call read(task) in a reader thread,
+    transform(task, data) in the current thread, and write(task, output) in a
+    writer thread. transform() returns (output, result): 'output' is passed to
+    write() unless it's None, 'result' is yielded.
+
+    An exception in any stage stops the pipeline and is raised here, after
+    pending writes are finished.
+    """
+    read_queue = queue.Queue(maxsize=queue_size)
+    write_queue = queue.Queue(maxsize=queue_size)
+    write_errors = []
+    reader = threading.Thread(
+        target=_read_stage, args=(tasks, read, read_queue), daemon=True
+    )
+    writer = threading.Thread(
+        target=_write_stage, args=(write, write_queue, write_errors), daemon=True
+    )
+    reader.start()
+    writer.start()
+
+    try:
+        while not write_errors:
+            item = read_queue.get()
+            if item is _DONE:
+                break
+            task, data, error = item
+            if error is not None:
+                raise error
+            output, result = transform(task, data)
+            if output is not None:
+                write_queue.put((task, output))
+            yield result
+    finally:
+        write_queue.put(_DONE)
+        writer.join()
+
+    if write_errors:
+        raise write_errors[0]
@@ -0,0 +1,109 @@
+#! /usr/bin/env python3
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Size-aware scheduling of per-locale work on a pool of worker processes.
+
+Localized files vary a lot in size (a fully translated locale is much bigger
+than an almost empty one), so tasks are started largest first: the biggest
+files don't end up alone on the critical path at the end of the run. Each task
+declares an estimated 'cost' (bytes held in memory while it runs), and the
+number of tasks in flight is capped so that the sum of their costs stays
+within an optional memory budget.
+"""
+
+import os
+import time
+
+# Approximate memory used by a parsed lxml tree, as a multiple of the size of
+# the XML file on disk.
+TREE_MEMORY_FACTOR = 8
+
+
+def _timed_call(worker, task):
+    """
+    Run worker(task) and return (pid, busy seconds, result), to account for
+    each worker process' utilization.
+    """
+    start = time.perf_counter()
+    result = worker(task)
+    return os.getpid(), time.perf_counter() - start, result
+
+
+def _next_task(pending, available_memory):
+    """
+    Pop and return the largest pending task fitting in 'available_memory'
+    (any task if there is no budget), or None if none fits. 'pending' is
+    sorted by decreasing cost.
+    """
+    for index, task in enumerate(pending):
+        if available_memory is None or task["cost"] <= available_memory:
+            return pending.pop(index)
+    return None
+
+
+def schedule_tasks(tasks, worker, jobs=1, max_memory=None):
+    """
+    Run worker(task) for every task (a dict with at least a 'cost' key) and
+    yield each result as soon as it's available.
+
+    With a single job, tasks run in the current process, in the given order,
+    and 'max_memory' doesn't apply (only one task is ever in flight).
+    Otherwise they run on a pool of 'jobs' processes, largest first, never
+    starting a task if the total cost of tasks in flight would exceed
+    'max_memory' bytes (a task is always started when nothing else is running,
+    so a single oversized task can't block the run). 'worker' must be a
+    module-level function, so it can be sent to the worker processes.
+
+    Per-worker utilization is printed once all tasks are done, if there were
+    any.
+    """
+    if jobs <= 1:
+        for task in tasks:
+            yield worker(task)
+        return
+
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    pending = sorted(tasks, key=lambda task: task["cost"], reverse=True)
+    if not pending:
+        return
+    in_flight = {}
+    used_memory = 0
+    busy_time = {}
+    task_count = {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        while pending or in_flight:
+            while pending and len(in_flight) < jobs:
+                available_memory = (
+                    max_memory - used_memory
+                    if max_memory is not None and in_flight
+                    else None
+                )
+                task = _next_task(pending, available_memory)
+                if task is None:
+                    break
+                future = executor.submit(_timed_call, worker, task)
+                in_flight[future] = task
+                used_memory += task["cost"]
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                task = in_flight.pop(future)
+                used_memory -= task["cost"]
+                pid, busy, result = future.result()
+                busy_time[pid] = busy_time.get(pid, 0) + busy
+                task_count[pid] = task_count.get(pid, 0) + 1
+                yield result
+
+    elapsed = time.perf_counter() - start
+    print(f"Worker utilization ({elapsed:.1f}s elapsed):")
+    for number, pid in enumerate(sorted(busy_time), start=1):
+        utilization = busy_time[pid] / elapsed if elapsed else 0
+        print(
+            f"  worker {number}: {task_count[pid]} tasks, "
+            f"{busy_time[pid]:.1f}s busy ({utilization:.0%})"
+        )
@@ -0,0 +1,208 @@
+#! /usr/bin/env python3
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Working cache of localized files split in shards, one per <file> element,
+used by 'update_other_locales.py --cache' in 'standard' mode.
+
+For every localized file written by the script, a manifest records the digest
+of the whole file, and the position, digest and trans-unit IDs of each shard.
+A snapshot of the reference stores a digest of the sources of every ID, as
+indexed by build_reference_index().
+
+On the next run, a localized file with the same digest as in its manifest is
+exactly what was written (i.e. already serialized like write_xliff() does).
+Only its shards containing an ID whose sources changed in the reference since
+then ('dirty' IDs) can be affected by the update: they're parsed and updated
+on their own, and serialized back in place, with the same result as
+processing the whole file. If no shard changed, the file isn't written.
+
+Files modified since they were written (e.g. by Pontoon), or without manifest,
+go through a full update, and get a new manifest.
+
+Shards are only used by 'standard' updates: 'nofile' and 'matchid' updates
+rebuild the whole file from the reference, and the check scripts read whole
+files.
+
+Cache layout: <cache>/reference/<file>.json for reference snapshots,
+<cache>/<locale>/<file>.json for manifests.
+"""
+
+import hashlib
+import json
+import os
+
+from functions import (
+    FILE_TAG,
+    TRANS_UNIT_TAG,
+    digest_content,
+    serialize_xliff,
+    split_segments,
+    write_content,
+)
+from lxml import etree
+
+
+def cache_path(cache_folder, folder, filename):
+    return os.path.join(cache_folder, folder, f"{filename}.json")
+
+
+def read_json(path):
+    """Return the content of a JSON file, or None if missing or broken."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_content(json.dumps(data).encode("utf-8"), path)
+
+
+def snapshot_reference(reference_index):
+    """
+    Return {id: digest} for a reference index (see
+    update_other_locales.build_reference_index), each digest covering the
+    sources of an ID in every <file>.
+    """
+    snapshot = {}
+    for tu_id, sources_by_file in reference_index.items():
+        key = sorted(
+            (repr(original), sorted(repr(source) for source in sources))
+            for original, sources in sources_by_file.items()
+        )
+        snapshot[tu_id] = hashlib.blake2b(
+            repr(key).encode("utf-8"), digest_size=8
+        ).hexdigest()
+    return snapshot
+
+
+def find_dirty_ids(cache_folder, filename, reference_digest, reference_index):
+    """
+    Return {reference digest: dirty IDs} for the reference versions a manifest
+    can refer to: the current one (no dirty ID), and the one of the last
+    snapshot, with the IDs added, removed, or with different sources since.
+    """
+    current = snapshot_reference(reference_index)
+    dirty_ids = {reference_digest: set()}
+    snapshot = read_json(cache_path(cache_folder, "reference", filename))
+    if snapshot is not None and snapshot["digest"] != reference_digest:
+        previous = snapshot["ids"]
+        dirty_ids[snapshot["digest"]] = {
+            tu_id
+            for tu_id in previous.keys() | current.keys()
+            if previous.get(tu_id) != current.get(tu_id)
+        }
+    return dirty_ids
+
+
+def save_reference_snapshot(cache_folder, filename, reference_digest, reference_index):
+    """Store the snapshot of the current reference, replacing the previous one."""
+    write_json(
+        cache_path(cache_folder, "reference", filename),
+        {"digest": reference_digest, "ids": snapshot_reference(reference_index)},
+    )
+
+
+def build_manifest(content, root, reference_digest):
+    """
+    Return the manifest of a file written by write_xliff(), with 'root' the
+    tree written: its digest, the reference version it was updated against,
+    and its shards as [original, start, end, digest, ids]. Return None if the
+    file can't be split in shards.
+    """
+    segments = split_segments(content, root)
+    if len(segments) == 1:
+        return None
+    file_ids = [
+        [trans_node.get("id") for trans_node in file_node.iter(TRANS_UNIT_TAG)]
+        for file_node in root.iter(FILE_TAG)
+    ]
+    shards = []
+    for original, start, end in segments:
+        if original is not None:
+            shards.append(
+                [
+                    original,
+                    start,
+                    end,
+                    digest_content(content[start:end]),
+                    file_ids[len(shards)],
+                ]
+            )
+    return {
+        "digest": digest_content(content),
+        "reference": reference_digest,
+        "shards": shards,
+    }
+
+
+def load_manifest(cache_folder, locale, filename):
+    return read_json(cache_path(cache_folder, locale, filename))
+
+
+def save_manifest(cache_folder, locale, filename, manifest):
+    path = cache_path(cache_folder, locale, filename)
+    if manifest is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    write_json(path, manifest)
+
+
+def update_shards(content, manifest, dirty_ids, update):
+    """
+    Update the shards of a file containing dirty IDs, and return the new
+    content (bytes), identical to 'content' if nothing changed, and its
+    manifest. 'update' is called with the root of a document holding only the
+    shard to update, and modifies it in place without adding or removing
+    trans-units.
+
+    Each shard is parsed with the text before the first shard (XML declaration
+    and root element), and serialized with serialize_xliff(): its indentation
+    is the same as in the whole document.
+    """
+    shards = manifest["shards"]
+    prolog = content[: shards[0][1]]
+    parts = []
+    new_shards = []
+    position = 0
+    # Difference between the positions in the new and old content.
+    shift = 0
+    for original, start, end, shard_digest, ids in shards:
+        if dirty_ids.isdisjoint(ids):
+            new_shards.append([original, start + shift, end + shift, shard_digest, ids])
+            continue
+        shard = content[start:end]
+        if digest_content(shard) != shard_digest:
+            raise ValueError(f"Shard {original} doesn't match the manifest")
+        root = etree.fromstring(prolog + shard + b"</xliff>")
+        update(root)
+        serialized = serialize_xliff(root).encode("utf-8")
+        segments = split_segments(serialized, root)
+        if len(segments) != 3:
+            raise ValueError(f"Can't serialize shard {original} on its own")
+        _, new_start, new_end = segments[1]
+        new_shard = serialized[new_start:new_end]
+        parts.append(content[position:start])
+        parts.append(new_shard)
+        position = end
+        new_shards.append(
+            [
+                original,
+                start + shift,
+                start + shift + len(new_shard),
+                digest_content(new_shard),
+                ids,
+            ]
+        )
+        shift += len(new_shard) - (end - start)
+    parts.append(content[position:])
+    new_content = b"".join(parts)
+    if new_content != content:
+        manifest = dict(manifest, digest=digest_content(new_content), shards=new_shards)
+    return new_content, manifest
@@ -6,12 +6,82 @@
 
 """
 update_other_locales.py --reference <locale> --path <folder>
-     [--type standard|nofile|matchid] [--project <name>] [locales...]
+     [--type standard|nofile|matchid] [--project <name>] [--since <git-ref>]
+     [--jobs <n>] [--max-memory <MB>] [--locale-major] [--pipeline] [--watch]
+     [--journal <file> [--resume]] [--cache <folder>] [--metrics-file <file>]
+     [--memory-profile <file> [--memory-baseline <file>]
+     [--memory-threshold <percent>]] [locales...]
+update_other_locales.py --batch <file> [--jobs <n>] [--max-memory <MB>]
+     [--locale-major]
 
  --project selects the locale mapping and excluded folders from
  locale_config.py. When no project name is provided, empty defaults are used
  (no remapping, no excluded folders).
 
+ --since limits processing to locales with XLIFF files changed since the given
+ git reference (e.g. 'origin/main'). If the reference locale itself changed,
+ every locale is processed.
+
+ --jobs updates locales in parallel worker processes, starting with the
+ largest files. --max-memory caps the estimated memory of the files being
+ updated at the same time (only with more than one job); per-worker
+ utilization is reported at the end.
+
+ --locale-major schedules one task per locale instead of one per file: all
+ reference files are parsed and indexed up front, and each worker updates all
+ the files of a locale together (useful when the reference has more than one
+ XLIFF file).
+
+ --pipeline keeps a single process, but parses the next files and writes the
+ previous ones in background threads while the current one is updated.
+
+ --watch keeps running after the first update, and updates locales again
+ whenever the reference or a localized file changes. Parsed files are kept in
+ memory, so iterating on the reference doesn't pay for parsing every locale.
+
+ --journal records every updated file in a JSON Lines file (locale, file,
+ update type, and digests of the reference, input and output files), as soon
+ as it's written. With --resume, files recorded for the same reference and
+ update type, and not modified since, are skipped: an interrupted run can be
+ restarted without redoing the completed work. Without --resume, the journal
+ is started over. Files are always written atomically, so an interrupted run
+ never leaves a truncated file.
+
+ --cache keeps a working cache of the localized files in a folder, split by
+ <file> element ('standard' mode only, see shard_cache.py). A file not
+ modified since the previous run only gets its <file> elements with strings
+ changed in the reference since then updated, and is only written if one of
+ them changed, with the same result as a full update. Other update types,
+ and the check scripts (check_target_language.py, validate_xliff.py,
+ check_integrity.py), always process whole files.
+
+ --metrics-file writes the metrics of the run (see metrics.py), in JSON or in
+ Prometheus text format ('.prom' file): files processed and modified, units
+ scanned, targets dropped, moved and carried over, bytes read and written
+ (in total and per locale), and the duration of each stage.
+
+ --memory-profile records the memory used by each phase of the update (see
+ memory_profile.py), for the whole run and per locale: parse, index (of the
+ reference, and of the translations in rebuild modes), update ('standard') or
+ rebuild, carry-over, indent and serialize. Python allocations are traced
+ with tracemalloc, which makes the run slower, the RSS is sampled before and
+ after each phase, and the peak RSS of the whole run is recorded. The profile
+ is written as JSON, and printed. With --memory-baseline (a profile saved by
+ a previous run with the same options), phases whose allocations or RSS
+ growth, or a peak RSS of the run that grew by more than --memory-threshold
+ percent (default: 10) are listed, and the script exits with an error.
+
+ --batch runs several update jobs in one invocation, e.g. for sibling l10n
+ repositories checked out side by side. The tasks of all jobs share the same
+ pool of worker processes (--jobs, --max-memory and --locale-major apply to
+ all of them), and a summary is printed for each job. The batch file is a JSON
+ list of objects with:
+ - 'path' and 'reference' (required), like --path and --reference. A relative
+   path is relative to the batch file.
+ - 'project', 'type' and 'locales' (optional), like --project, --type and the
+   list of locales.
+ - 'name' (optional), used in the summary instead of the path.
+
  How each localized file is updated depends on the '--type' argument. The two
  behaviors exist because they serve different goals.
 
@@ -51,18 +121,53 @@ update_other_locales.py --reference <locale> --path <folder>
 """
 
 import argparse
+import hashlib
+import io
+import json
 import os
+import re
 import sys
+import time
 from argparse import RawTextHelpFormatter
 from copy import deepcopy
 from glob import glob
 
-from functions import list_locales, write_xliff
+from functions import (
+    NS,
+    TARGET_TAG,
+    digest_content,
+    digest_file,
+    get_changed_locales,
+    indent_xliff,
+    list_locales,
+    scan_file_nodes,
+    write_content,
+    write_xliff,
+)
 from locale_config import PROJECTS, get_locale_code, get_project_config
-from lxml import etree
+from memory_profile import (
+    add_phases,
+    compare_profiles,
+    format_size,
+    load_profile,
+    memory_phase,
+    new_profile,
+    print_profile,
+    record_peak_rss,
+    write_profile,
+)
+from metrics import add_counts, new_metrics, timed_stage, write_metrics
+from scheduler import TREE_MEMORY_FACTOR, schedule_tasks
 
-NS = {"x": "urn:oasis:names:tc:xliff:document:1.2"}
 UPDATE_TYPES = ("standard", "nofile", "matchid")
+# A <target> without attributes or child elements, right after <source>, in a
+# serialized <file> block (see file_digest).
+TARGET_PATTERN = re.compile(r"(?<=</source>)\s*<target(?:/>|>[^<]*</target>)")
+# Seconds between two checks for changes in --watch mode.
+WATCH_INTERVAL = 1
+
+# Parsed reference files, see get_reference().
+_reference_cache = {}
 
 
 def translation_key(update_type, original_id, source_string):
@@ -106,6 +211,61 @@ def reorder_attributes(node, preferred_order):
         node.set(key, current[key])
 
 
+def file_digest(file_node, units):
+    """
+    Return a digest of the content of a <file> block, as written in a rebuilt
+    localized file, with 'units' as returned by scan_file_nodes(). Two blocks
+    with the same digest only differ by:
+    - The text of <target> elements without attributes placed right after
+      <source>. A missing <target> counts as one of those, since that's where
+      rebuild_from_reference() inserts new targets.
+    - The 'target-language' attribute and the order of the <file> attributes,
+      both set by rebuild_from_reference().
+
+    Whitespace is compared as is: blocks indented differently don't match.
+
+    Return None if the block can't be compared: a <trans-unit> without
+    <source>, an ID used more than once, or comments and processing
+    instructions (their content isn't escaped, see TARGET_PATTERN).
+    """
+    from lxml import etree
+
+    if any(source is None for _, source, _ in units):
+        return None
+    if len({trans_node.get("id") for trans_node, _, _ in units}) != len(units):
+        return None
+    content = etree.tostring(file_node, encoding="unicode", with_tail=False)
+    if "<!--" in content or "<?" in content:
+        return None
+    header = (
+        sorted(file_node.nsmap.items(), key=repr),
+        sorted(
+            (key, value)
+            for key, value in file_node.attrib.items()
+            if key != "target-language"
+        ),
+    )
+    # Attribute values can't contain '>' once serialized, it's escaped.
+    body = TARGET_PATTERN.sub("", content[content.index(">") + 1 :])
+    digest = hashlib.blake2b(repr(header).encode("utf-8"), digest_size=16)
+    digest.update(body.encode("utf-8"))
+    return digest.digest()
+
+
+def build_file_digests(root):
+    """
+    Return {original: digest} for every <file> block of a document (see
+    file_digest). Blocks sharing the same 'original' get None.
+    """
+    digests = {}
+    for file_node, units in scan_file_nodes(root):
+        original = file_node.get("original")
+        digests[original] = (
+            file_digest(file_node, units) if original not in digests else None
+        )
+    return digests
+
+
 def build_reference_index(reference_root, filename):
     """
     Index the reference content as {id: {original_file: set(sources)}}.
@@ -132,14 +292,20 @@ def build_reference_index(reference_root, filename):
     return reference_index
 
 
-def update_in_place(reference_index, locale_root):
+def update_in_place(reference_index, locale_root, changed=None, stats=None):
     """
     'standard' mode: remove a localized <target> when the source text changed
     in the reference for the same XLIFF file, or when the string moved to a
     different <file> and its source text changed. Strings removed upstream,
     and pure moves where the source text is unchanged, are left untouched.
+
+    If 'changed' is a list, every <trans-unit> losing its <target> is added to
+    it (see functions.serialize_xliff). If 'stats' is a dict (see
+    new_file_stats), units scanned and targets dropped are counted in it.
     """
     for file_original, trans_node in iter_units_by_filenode(locale_root):
+        if stats is not None:
+            stats["units"] += 1
         target = trans_node.find("x:target", namespaces=NS)
         if target is None:
             # Untranslated string, nothing to do.
@@ -169,14 +335,24 @@ def update_in_place(reference_index, locale_root):
                 all_sources.update(file_sources)
             if source_node.text not in all_sources:
                 target.getparent().remove(target)
+                if changed is not None:
+                    changed.append(trans_node)
+                if stats is not None:
+                    stats["dropped"] += 1
             continue
 
         # Same file: remove only when the source text actually changed here.
         if source_node.text not in files_for_id:
             target.getparent().remove(target)
+            if changed is not None:
+                changed.append(trans_node)
+            if stats is not None:
+                stats["dropped"] += 1
 
 
-def carry_over_obsolete(new_root, locale_root, reference_ids, locale_code):
+def carry_over_obsolete(
+    new_root, locale_root, reference_ids, locale_code, changed=None, stats=None
+):
     """
     Keep strings that no longer exist in the reference (removed upstream) in the
     rebuilt localized file, so their removal is left to Pontoon instead of the
@@ -191,6 +367,10 @@ def carry_over_obsolete(new_root, locale_root, reference_ids, locale_code):
                    for what obsolete strings existed and where).
     - reference_ids: set of every trans-unit ID that still exists in the
                      reference. An ID not in this set = obsolete string.
+    - changed: if a list, every element receiving a new child is added to it
+               (see functions.serialize_xliff).
+    - stats: if a dict (see new_file_stats), translated obsolete strings are
+             counted in it as carried over.
     """
 
     new_file_nodes = {
@@ -237,6 +417,8 @@ def carry_over_obsolete(new_root, locale_root, reference_ids, locale_code):
                 new_root.insert(0, new_dest)
             else:
                 file_anchor.addnext(new_dest)
+            if changed is not None:
+                changed.append(new_root)
             new_file_nodes[file_original] = new_dest
             file_anchor = new_dest
 
@@ -251,6 +433,8 @@ def carry_over_obsolete(new_root, locale_root, reference_ids, locale_code):
             new_dest_index.setdefault(tu_candidate.get("id"), tu_candidate)
 
         # Walk the localized units in order, reinserting the obsolete ones.
+        if changed is not None:
+            changed.append(new_dest_body)
         anchor = None
         for tu in old_loc_trans_units:
             tu_id = tu.get("id")
@@ -264,9 +448,19 @@ def carry_over_obsolete(new_root, locale_root, reference_ids, locale_code):
                 else:
                     anchor.addnext(copy)
                 anchor = copy
-
-
-def rebuild_from_reference(reference_tree, locale_root, update_type, locale_code):
+                if stats is not None and copy.find(TARGET_TAG) is not None:
+                    stats["carried_over"] += 1
+
+
+def rebuild_from_reference(
+    reference_tree,
+    locale_root,
+    update_type,
+    locale_code,
+    changed=None,
+    reference_digests=None,
+    stats=None,
+):
     """
     'nofile'/'matchid' mode: return a new localized tree built from the
     reference structure, with existing translations injected. Because it's
@@ -277,15 +471,29 @@ def rebuild_from_reference(reference_tree, locale_root, update_type, locale_code
     to Pontoon instead, and reducing merge conflicts.
 
     'locale_root' is the current localized content of an existing file.
+    If 'changed' is a list, every element gaining or losing a child is added
+    to it (see functions.serialize_xliff).
+
+    Most <file> blocks are usually identical in the reference and the
+    localized file, translations aside: when both have the same digest (see
+    file_digest), rebuilding the block would give the localized block back, so
+    it's copied instead. 'reference_digests' avoids computing the reference
+    digests for every locale (see build_file_digests).
+
+    If 'stats' is a dict (see new_file_stats), it counts the localized units
+    scanned, and the translations moved to a different <file>, dropped (string
+    still in the reference, but no match) or carried over.
     """
+    from lxml import etree
+
+    if reference_digests is None:
+        reference_digests = build_file_digests(reference_tree.getroot())
+
     # Remember each localized <file>'s attribute order, to restore it on the
     # rebuilt tree (which otherwise inherits the reference's order).
     # Without this, different automations (this script, extraction, Pontoon)
     # would start fighting over the attribute order, creating unnecessary diffs.
-    locale_file_attr_order = {
-        fn.get("original"): list(fn.attrib.keys())
-        for fn in locale_root.xpath("//x:file", namespaces=NS)
-    }
+    locale_file_attr_order = {}
 
     # Collect existing translations, keyed according to the update type. Keep a
     # per-file map so a shared ID (e.g. iOS default IDs reused across files with
@@ -294,92 +502,863 @@ def rebuild_from_reference(reference_tree, locale_root, update_type, locale_code
     # moved to a different <file> block.
     translations_by_file = {}
     translations_any = {}
-    for file_original, trans_node in iter_units_by_filenode(locale_root):
-        target = trans_node.find("x:target", namespaces=NS)
-        if target is None:
-            continue
-        source_node = trans_node.find("x:source", namespaces=NS)
-        source_string = source_node.text if source_node is not None else None
-        key = translation_key(update_type, trans_node.get("id"), source_string)
-        translations_by_file[(file_original, key)] = target.text
-        translations_any.setdefault(key, target.text)
+    # With 'stats': (original, key, id) of every translated unit, the
+    # <file> each translation_any comes from, and the translations used.
+    translated_units = []
+    translation_origins = {}
+    used_translations = set()
+    # {original: (file_node, units)} for localized blocks with the same digest
+    # as in the reference, None otherwise (including for an 'original' shared
+    # by several blocks, which translations_by_file can't tell apart).
+    unchanged_files = {}
+    with memory_phase(stats, "index"):
+        for file_node, units in scan_file_nodes(locale_root):
+            file_original = file_node.get("original")
+            locale_file_attr_order[file_original] = list(file_node.attrib.keys())
+            reference_digest = reference_digests.get(file_original)
+            if (
+                file_original not in unchanged_files
+                and reference_digest is not None
+                and file_digest(file_node, units) == reference_digest
+            ):
+                unchanged_files[file_original] = (file_node, units)
+            else:
+                unchanged_files[file_original] = None
+            for trans_node, source_node, target in units:
+                if target is None:
+                    continue
+                source_string = source_node.text if source_node is not None else None
+                key = translation_key(update_type, trans_node.get("id"), source_string)
+                translations_by_file[(file_original, key)] = target.text
+                translations_any.setdefault(key, target.text)
+                if stats is not None:
+                    translated_units.append((file_original, key, trans_node.get("id")))
+                    translation_origins.setdefault(key, file_original)
+            if stats is not None:
+                stats["units"] += len(units)
+
+        # An untranslated unit gets the translation of the same string from another
+        # <file> block, if there is one: the block can't be copied as is.
+        for file_original, unchanged in list(unchanged_files.items()):
+            if unchanged is None:
+                del unchanged_files[file_original]
+                continue
+            for trans_node, source_node, target in unchanged[1]:
+                if target is not None:
+                    continue
+                key = translation_key(
+                    update_type, trans_node.get("id"), source_node.text
+                )
+                if key in translations_any:
+                    del unchanged_files[file_original]
+                    break
+
+    with memory_phase(stats, "rebuild"):
+        # Build the new localized tree from the reference structure.
+        new_tree = deepcopy(reference_tree)
+        new_root = new_tree.getroot()
+
+        reference_ids = {
+            tu.get("id") for tu in new_root.xpath("//x:trans-unit", namespaces=NS)
+        }
+
+        for file_node in new_root.xpath("//x:file", namespaces=NS):
+            file_original = file_node.get("original")
+            if file_original in unchanged_files:
+                # Replaced by the localized block below.
+                continue
+            for trans_node in file_node.xpath(".//x:trans-unit", namespaces=NS):
+                source_node = trans_node.find("x:source", namespaces=NS)
+                if source_node is None:
+                    # Malformed reference unit (broken extraction): can't match or
+                    # inject a translation without a <source> to anchor it.
+                    # Log and skip.
+                    print(
+                        f"WARNING: Skipping trans-unit '{trans_node.get('id')}' without source"
+                    )
+                    continue
+                source_string = source_node.text
+                key = translation_key(update_type, trans_node.get("id"), source_string)
+
+                # Prefer the translation from the same file; fall back to any file
+                # only to relocate a string that moved to a different <file> block.
+                file_key = (file_original, key)
+                if file_key in translations_by_file:
+                    translation = translations_by_file[file_key]
+                    has_translation = True
+                    if stats is not None:
+                        used_translations.add(file_key)
+                elif key in translations_any:
+                    translation = translations_any[key]
+                    has_translation = True
+                    if stats is not None:
+                        stats["moved"] += 1
+                        used_translations.add((translation_origins[key], key))
+                else:
+                    has_translation = False
+
+                existing_target = trans_node.find("x:target", namespaces=NS)
+                if has_translation:
+                    if existing_target is not None:
+                        existing_target.text = translation
+                    else:
+                        # Insert a new <target> right after <source>, in the XLIFF
+                        # namespace so the in-memory tree matches what is written to
+                        # disk (a bare etree.Element("target") would be namespaceless
+                        # in memory and only pick up the default namespace on save).
+                        target = etree.Element(f"{{{NS['x']}}}target")
+                        target.text = translation
+                        source_node.addnext(target)
+                        if changed is not None:
+                            changed.append(trans_node)
+                elif existing_target is not None:
+                    # No translation available, remove the target.
+                    existing_target.getparent().remove(existing_target)
+                    if changed is not None:
+                        changed.append(trans_node)
 
-    # Build the new localized tree from the reference structure.
-    new_tree = deepcopy(reference_tree)
-    new_root = new_tree.getroot()
+    # Preserve strings removed from the reference (see carry_over_obsolete).
+    # This prevents the diff from growing unnecessarily, leaving the removal
+    # to Pontoon instead, and reducing merge conflicts.
+    with memory_phase(stats, "carry-over"):
+        carry_over_obsolete(
+            new_root, locale_root, reference_ids, locale_code, changed, stats
+        )
+    if stats is not None:
+        # Blocks copied as is keep all their translations.
+        stats["dropped"] += sum(
+            1
+            for file_original, key, tu_id in translated_units
+            if tu_id in reference_ids
+            and file_original not in unchanged_files
+            and (file_original, key) not in used_translations
+        )
 
-    reference_ids = {
-        tu.get("id") for tu in new_root.xpath("//x:trans-unit", namespaces=NS)
-    }
+    with memory_phase(stats, "rebuild"):
+        # Set the target-language on every <file> node to the locale code, and
+        # restore the localized file's attribute order to avoid noise diffs.
+        for file_node in new_root.xpath("//x:file", namespaces=NS):
+            file_original = file_node.get("original")
+            if file_original in unchanged_files:
+                # Copy the localized block, keeping the reference indentation
+                # around it. Its own content may not be indented yet.
+                locale_copy = deepcopy(unchanged_files[file_original][0])
+                locale_copy.tail = file_node.tail
+                file_node.getparent().replace(file_node, locale_copy)
+                if changed is not None:
+                    changed.append(locale_copy)
+                file_node = locale_copy
+            file_node.set("target-language", locale_code)
+            preferred = locale_file_attr_order.get(file_original)
+            if preferred:
+                reorder_attributes(file_node, preferred)
 
-    for file_original, trans_node in iter_units_by_filenode(new_root):
-        source_node = trans_node.find("x:source", namespaces=NS)
-        if source_node is None:
-            # Malformed reference unit (broken extraction): can't match or
-            # inject a translation without a <source> to anchor it.
-            # Log and skip.
-            print(
-                f"WARNING: Skipping trans-unit '{trans_node.get('id')}' without source"
-            )
-            continue
-        source_string = source_node.text
-        key = translation_key(update_type, trans_node.get("id"), source_string)
-
-        # Prefer the translation from the same file; fall back to any file only
-        # to relocate a string that moved to a different <file> block.
-        file_key = (file_original, key)
-        if file_key in translations_by_file:
-            translation = translations_by_file[file_key]
-            has_translation = True
-        elif key in translations_any:
-            translation = translations_any[key]
-            has_translation = True
+    return new_tree
+
+
+def load_reference(reference_file_path, filename, update_type, stats=None):
+    """
+    Parse a reference file and return (reference_tree, reference_index). The
+    memory used by each phase is recorded in 'stats', if set (see
+    memory_profile.memory_phase).
+
+    'standard' only needs an index of the reference sources per ID, built once
+    per reference file instead of within the locale loop; the rebuild modes
+    work on the tree itself, and get the digests of its <file> blocks as index
+    (see build_file_digests).
+
+    In rebuild modes the reference tree is indented here, once: every rebuilt
+    tree starts as a copy of it, so only the regions changed by the rebuild
+    need to be indented before writing (see update_locale_tree).
+    """
+    from lxml import etree
+
+    with memory_phase(stats, "parse"):
+        reference_tree = etree.parse(reference_file_path)
+    if update_type != "standard":
+        with memory_phase(stats, "indent"):
+            etree.indent(reference_tree)
+    with memory_phase(stats, "index"):
+        if update_type == "standard":
+            reference_index = build_reference_index(reference_tree.getroot(), filename)
         else:
-            has_translation = False
+            reference_index = build_file_digests(reference_tree.getroot())
+    return reference_tree, reference_index
+
+
+def get_reference(reference_file_path, filename, update_type, stats=None):
+    """
+    Return (reference_tree, reference_index) for a reference file, parsing it
+    only once per process (see load_reference, 'stats' only being used then).
+    """
+    key = (reference_file_path, update_type)
+    if key not in _reference_cache:
+        _reference_cache[key] = load_reference(
+            reference_file_path, filename, update_type, stats
+        )
+    return _reference_cache[key]
+
+
+def update_locale_tree(
+    reference_tree,
+    reference_index,
+    locale_tree,
+    l10n_file,
+    update_type,
+    locale_code,
+    indented=False,
+    stats=None,
+):
+    """
+    Update a parsed localized file according to 'update_type', and return
+    (tree to write to 'l10n_file', changed elements). 'changed' lists the
+    elements to indent again before writing, or is None if the whole tree
+    needs to be indented (see functions.serialize_xliff). Changes are counted
+    in 'stats', if set (see new_file_stats).
+
+    Rebuilt trees are copies of the reference, already indented by
+    load_reference(). In 'standard' mode the localized tree is parsed from
+    disk, so its indentation can only be trusted if 'indented' is set (e.g. a
+    tree kept in memory after being written).
+    """
+    if update_type == "standard":
+        # In-place update.
+        print(f"Processing {l10n_file} in {update_type} mode")
+        changed = [] if indented else None
+        with memory_phase(stats, "update"):
+            update_in_place(reference_index, locale_tree.getroot(), changed, stats)
+        return locale_tree, changed
+
+    # Rebuild from reference, moving existing translations.
+    print(f"Updating {l10n_file} in {update_type} mode")
+    changed = []
+    new_tree = rebuild_from_reference(
+        reference_tree,
+        locale_tree.getroot(),
+        update_type,
+        locale_code,
+        changed,
+        reference_index,
+        stats,
+    )
+    return new_tree, changed
+
+
+def new_file_stats(task):
+    """
+    Return the stats of a task (see main), filled while the file is updated
+    and used for --metrics-file:
+    - 'updated': the file was parsed and written; 'modified': its content
+      changed.
+    - 'units': localized units scanned; 'dropped', 'moved', 'carried_over':
+      targets removed, moved to a different <file>, or kept for an obsolete
+      string (see update_in_place and rebuild_from_reference).
+    - 'bytes_read', 'bytes_written', and the seconds spent in each step.
+    - 'memory' and 'memory_snapshots', only with --memory-profile: the memory
+      used by each phase (see memory_profile.memory_phase).
+    """
+    stats = {
+        "locale": task["locale"],
+        "file": task["filename"],
+        "updated": False,
+        "modified": False,
+        "units": 0,
+        "dropped": 0,
+        "moved": 0,
+        "carried_over": 0,
+        "bytes_read": 0,
+        "bytes_written": 0,
+        "parse_seconds": 0.0,
+        "update_seconds": 0.0,
+        "write_seconds": 0.0,
+    }
+    if task.get("memory_profile"):
+        stats["memory"] = {}
+        stats["memory_snapshots"] = task.get("memory_snapshots", False)
+    return stats
+
+
+def read_task(task):
+    """
+    Parse the localized file of a task (a dict, see main). Return
+    (tree, stats), with None as tree if it can't be parsed.
+    """
+    try:
+        with open(task["l10n_file"], "rb") as f:
+            content = f.read()
+    except Exception as e:
+        print(f"ERROR: Can't read {task['l10n_file']}")
+        print(e)
+        return None, new_file_stats(task)
+    return parse_task_content(task, content)
+
+
+def parse_task_content(task, content):
+    """Like read_task(), for the content of the localized file."""
+    from lxml import etree
+
+    stats = new_file_stats(task)
+    start = time.perf_counter()
+    try:
+        with memory_phase(stats, "parse"):
+            locale_tree = etree.parse(io.BytesIO(content))
+    except Exception as e:
+        print(f"ERROR: Can't parse {task['l10n_file']}")
+        print(e)
+        return None, stats
+    stats["bytes_read"] = len(content)
+    stats["input_digest"] = digest_content(content)
+    stats["parse_seconds"] = time.perf_counter() - start
+    return locale_tree, stats
+
+
+def transform_task(task, data):
+    """
+    Update the parsed localized file of a task, 'data' being the output of
+    read_task(). Return ((tree to write, changed elements, stats), stats), or
+    (None, stats) if the file couldn't be parsed.
+    """
+    locale_tree, stats = data
+    if locale_tree is None:
+        return None, stats
+    start = time.perf_counter()
+    reference_tree, reference_index = get_reference(
+        task["reference_file_path"], task["filename"], task["update_type"]
+    )
+    new_tree, changed = update_locale_tree(
+        reference_tree,
+        reference_index,
+        locale_tree,
+        task["l10n_file"],
+        task["update_type"],
+        task["locale_code"],
+        stats=stats,
+    )
+    stats["update_seconds"] = time.perf_counter() - start
+    return (new_tree, changed, stats), stats
+
+
+def load_journal(journal_file):
+    """
+    Return the entries of a journal as {(locale, file): entry}, the last one
+    winning. A line cut short by an interrupted run is ignored.
+    """
+    entries = {}
+    try:
+        with open(journal_file, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                entries[(entry["locale"], entry["file"])] = entry
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def record_task(task, output_digest):
+    """
+    Append a completed task to the journal, if there is one (see main), with
+    the digest of the content written. Each entry is a single write to a file
+    opened in append mode, so worker processes can record their tasks
+    concurrently.
+    """
+    if task.get("journal") is None:
+        return
+    entry = {
+        "locale": task["locale"],
+        "file": task["filename"],
+        "update_type": task["update_type"],
+        "reference_digest": task["reference_digest"],
+        "input_digest": task["input_digest"],
+        "output_digest": output_digest,
+    }
+    with open(task["journal"], "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+def write_task(task, output, fsync=True):
+    """
+    Write the updated tree of a task (see transform_task), by default waiting
+    until it's on disk, complete its stats, and return the content written.
+    """
+    new_tree, changed, stats = output
+    start = time.perf_counter()
+    with memory_phase(stats, "indent"):
+        indent_xliff(new_tree, changed)
+    with memory_phase(stats, "serialize"):
+        # Already indented.
+        content = write_xliff(new_tree, task["l10n_file"], fsync=fsync, changed=[])
+    output_digest = digest_content(content)
+    record_task(task, output_digest)
+    stats["write_seconds"] = time.perf_counter() - start
+    stats["updated"] = True
+    stats["bytes_written"] = len(content)
+    stats["modified"] = output_digest != stats.pop("input_digest")
+    return content
+
+
+def process_task(task):
+    """
+    Parse, update and write one localized file, described by a task dict (see
+    main), and return its stats (see new_file_stats). 'updated' is False if
+    the file couldn't be parsed.
+
+    Used as the scheduler worker, so it can run in a separate process.
+    """
+    if task.get("cache") is not None:
+        return process_cached_task(task)
+    output, stats = transform_task(task, read_task(task))
+    if output is not None:
+        write_task(task, output, fsync=False)
+    return stats
+
+
+def process_cached_task(task):
+    """
+    Like process_task(), with the shard cache of --cache ('standard' mode
+    only, see shard_cache.py). If the file wasn't modified since it was last
+    written, only the <file> elements with strings changed in the reference
+    since then are updated, and the file is only written if one of them
+    changed. Otherwise the whole file is updated, and its manifest rebuilt.
+    """
+    from shard_cache import build_manifest, load_manifest, save_manifest
+
+    l10n_file = task["l10n_file"]
+    try:
+        with open(l10n_file, "rb") as f:
+            content = f.read()
+    except Exception as e:
+        print(f"ERROR: Can't read {l10n_file}")
+        print(e)
+        return new_file_stats(task)
+
+    manifest = load_manifest(task["cache"], task["locale"], task["filename"])
+    if manifest is not None and manifest["digest"] == digest_content(content):
+        dirty_ids = task["dirty_ids"].get(manifest["reference"])
+        if dirty_ids is not None:
+            try:
+                return update_cached_shards(task, content, manifest, dirty_ids)
+            except Exception as e:
+                print(f"WARNING: Can't use the cache for {l10n_file}\n{e}")
+
+    output, stats = transform_task(task, parse_task_content(task, content))
+    if output is not None:
+        content = write_task(task, output, fsync=False)
+        manifest = build_manifest(
+            content, output[0].getroot(), task["reference_digest"]
+        )
+        save_manifest(task["cache"], task["locale"], task["filename"], manifest)
+    return stats
 
-        existing_target = trans_node.find("x:target", namespaces=NS)
-        if has_translation:
-            if existing_target is not None:
-                existing_target.text = translation
+
+def update_cached_shards(task, content, manifest, dirty_ids):
+    """
+    Update the <file> elements of a localized file containing 'dirty_ids',
+    from its 'content' and 'manifest' (see process_cached_task). Return the
+    stats of the task.
+    """
+    from shard_cache import save_manifest, update_shards
+
+    l10n_file = task["l10n_file"]
+    stats = new_file_stats(task)
+    stats["bytes_read"] = len(content)
+    shard_count = sum(
+        not dirty_ids.isdisjoint(shard[4]) for shard in manifest["shards"]
+    )
+    print(
+        f"Processing {l10n_file} in standard mode (cached, {shard_count} of "
+        f"{len(manifest['shards'])} <file> elements to update)"
+    )
+    start = time.perf_counter()
+    _, reference_index = get_reference(
+        task["reference_file_path"], task["filename"], task["update_type"]
+    )
+    new_content, manifest = update_shards(
+        content,
+        manifest,
+        dirty_ids,
+        lambda root: update_in_place(reference_index, root, stats=stats),
+    )
+    stats["update_seconds"] = time.perf_counter() - start
+    if new_content != content:
+        start = time.perf_counter()
+        write_content(new_content, l10n_file)
+        stats["write_seconds"] = time.perf_counter() - start
+        stats["bytes_written"] = len(new_content)
+        stats["modified"] = True
+    manifest["reference"] = task["reference_digest"]
+    save_manifest(task["cache"], task["locale"], task["filename"], manifest)
+    record_task(task, digest_content(new_content))
+    stats["updated"] = True
+    return stats
+
+
+def group_tasks_by_locale(tasks):
+    """
+    Group per-file tasks into one task per locale, listing the locale's files
+    under 'files' (in reference file order). The group's cost is the largest
+    of its files, since they're updated one at a time. In batch mode, the same
+    locale in different jobs gets different groups.
+    """
+    groups = {}
+    for task in tasks:
+        group = groups.setdefault(
+            (task.get("job"), task["locale"]),
+            {
+                "locale": task["locale"],
+                "job": task.get("job"),
+                "files": [],
+                "cost": 0,
+            },
+        )
+        group["files"].append(task)
+        group["cost"] = max(group["cost"], task["cost"])
+    return list(groups.values())
+
+
+def process_locale_task(group):
+    """
+    Update every file of a locale (a group from group_tasks_by_locale) in the
+    same worker, reusing the references already parsed by this process.
+    Return the list of stats of its files.
+    """
+    return [process_task(task) for task in group["files"]]
+
+
+def process_batch_task(task):
+    """
+    Like process_task(), returning (job index, [stats]) in batch mode, like
+    process_batch_locale_task().
+    """
+    return task["job"], [process_task(task)]
+
+
+def process_batch_locale_task(group):
+    """Like process_locale_task(), returning (job index, result) in batch mode."""
+    return group["job"], process_locale_task(group)
+
+
+def file_signature(path):
+    """
+    Return a cheap change marker for 'path' (modification time and size), or
+    None if the file doesn't exist.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def watch(
+    base_folder,
+    reference_locale,
+    reference_files,
+    locales,
+    update_type,
+    mapping,
+    interval=WATCH_INTERVAL,
+):
+    """
+    Keep running and update localized files whenever the reference or a
+    localized file changes on disk, until interrupted.
+
+    Parsed reference trees (with their index) and localized trees are kept in
+    memory between runs, so a change only costs the affected work: a changed
+    reference file is parsed and indexed again, and every locale is updated
+    against it from its cached tree; a changed localized file is parsed and
+    updated on its own. Changes are detected by polling file signatures, which
+    for a hundred files is cheap and doesn't need platform-specific APIs.
+    """
+    from lxml import etree
+
+    # {filename: (signature, reference_tree, reference_index)}
+    references = {}
+    # {l10n_file: (signature, locale_tree)}
+    locale_trees = {}
+
+    print(f"Watching {base_folder} for changes (Ctrl+C to stop)")
+    while True:
+        updated_files = 0
+        for filename in reference_files:
+            reference_file_path = os.path.join(base_folder, reference_locale, filename)
+            signature = file_signature(reference_file_path)
+            cached = references.get(filename)
+            reference_changed = cached is None or cached[0] != signature
+            if reference_changed:
+                try:
+                    reference_tree, reference_index = load_reference(
+                        reference_file_path, filename, update_type
+                    )
+                except Exception as e:
+                    # Likely saved mid-edit: wait for the next change.
+                    print(f"ERROR: Can't parse reference file {filename}\n{e}")
+                    references.pop(filename, None)
+                    continue
+                references[filename] = (signature, reference_tree, reference_index)
             else:
-                # Insert a new <target> right after <source>, in the XLIFF
-                # namespace so the in-memory tree matches what is written to
-                # disk (a bare etree.Element("target") would be namespaceless
-                # in memory and only pick up the default namespace on save).
-                target = etree.Element(f"{{{NS['x']}}}target")
-                target.text = translation
-                source_node.addnext(target)
-        elif existing_target is not None:
-            # No translation available, remove the target.
-            existing_target.getparent().remove(existing_target)
+                _, reference_tree, reference_index = cached
+
+            for locale in locales:
+                l10n_file = os.path.join(base_folder, locale, filename)
+                signature = file_signature(l10n_file)
+                if signature is None:
+                    locale_trees.pop(l10n_file, None)
+                    continue
+
+                cached = locale_trees.get(l10n_file)
+                indented = cached is not None and cached[0] == signature
+                if indented:
+                    # Unchanged since we wrote it: the cached tree is indented.
+                    if not reference_changed:
+                        continue
+                    locale_tree = cached[1]
+                else:
+                    try:
+                        locale_tree = etree.parse(l10n_file)
+                    except Exception as e:
+                        print(f"ERROR: Can't parse {l10n_file}")
+                        print(e)
+                        locale_trees.pop(l10n_file, None)
+                        continue
+
+                new_tree, changed = update_locale_tree(
+                    reference_tree,
+                    reference_index,
+                    locale_tree,
+                    l10n_file,
+                    update_type,
+                    get_locale_code(mapping, locale),
+                    indented,
+                )
+                write_xliff(new_tree, l10n_file, changed=changed)
+                # Record the signature after writing, so our own write isn't
+                # picked up as a change on the next poll.
+                locale_trees[l10n_file] = (file_signature(l10n_file), new_tree)
+                updated_files += 1
 
-    # Preserve strings removed from the reference (see carry_over_obsolete).
-    # This prevents the diff from growing unnecessarily, leaving the removal
-    # to Pontoon instead, and reducing merge conflicts.
-    carry_over_obsolete(new_root, locale_root, reference_ids, locale_code)
+        if updated_files:
+            print(f"{updated_files} files processed. Waiting for changes...")
+        time.sleep(interval)
 
-    # Set the target-language on every <file> node to the locale code, and
-    # restore the localized file's attribute order to avoid noise diffs.
-    for file_node in new_root.xpath("//x:file", namespaces=NS):
-        file_node.set("target-language", locale_code)
-        preferred = locale_file_attr_order.get(file_node.get("original"))
-        if preferred:
-            reorder_attributes(file_node, preferred)
 
-    return new_tree
+def list_reference_files(base_folder, reference_locale):
+    """
+    Return the paths of the reference XLIFF files, relative to the reference
+    locale folder. Exit if there is none.
+    """
+    reference_path = os.path.join(base_folder, reference_locale)
+    reference_files = []
+    for xliff_path in glob(reference_path + "/**/*.xliff", recursive=True):
+        reference_files.append(os.path.relpath(xliff_path, reference_path))
+    if not reference_files:
+        sys.exit(f"No reference file found in {reference_path}")
+    return reference_files
+
+
+def build_tasks(
+    base_folder,
+    reference_locale,
+    reference_files,
+    locales,
+    update_type,
+    mapping,
+    journal_file=None,
+    journal=None,
+):
+    """
+    Return (tasks, skipped files): a task dict for every localized file to
+    update. With a 'journal_file', tasks record their completion in it, and
+    files already updated according to 'journal' (see load_journal) are
+    skipped.
+    """
+    journal = journal or {}
+    skipped_files = 0
+
+    # Resolve each folder name to its XLIFF target-language code once.
+    locale_codes = {locale: get_locale_code(mapping, locale) for locale in locales}
+    tasks = []
+    for filename in reference_files:
+        # Read reference XML file. The parsed reference is cached, and reused
+        # by tasks running in this process (or in forked worker processes).
+        reference_file_path = os.path.join(base_folder, reference_locale, filename)
+        try:
+            reference_size = os.path.getsize(reference_file_path)
+            get_reference(reference_file_path, filename, update_type)
+            if journal_file is not None:
+                reference_digest = digest_file(reference_file_path)
+        except Exception as e:
+            sys.exit(f"ERROR: Can't parse reference file {filename}\n{e}")
+
+        for locale in locales:
+            l10n_file = os.path.join(base_folder, locale, filename)
+
+            # Every mode requires an existing localized file. In rebuild modes a
+            # missing file would only be recreated with no translations, so its
+            # creation is left to Pontoon.
+            if not os.path.isfile(l10n_file):
+                continue
+
+            # Estimate the memory held while updating this file: the parsed
+            # localized tree, plus a copy of the reference in rebuild modes.
+            cost = os.path.getsize(l10n_file)
+            if update_type != "standard":
+                cost += reference_size
+            task = {
+                "locale": locale,
+                "filename": filename,
+                "reference_file_path": reference_file_path,
+                "l10n_file": l10n_file,
+                "update_type": update_type,
+                "locale_code": locale_codes[locale],
+                "cost": cost * TREE_MEMORY_FACTOR,
+            }
+
+            if journal_file is not None:
+                task["journal"] = journal_file
+                task["reference_digest"] = reference_digest
+                task["input_digest"] = digest_file(l10n_file)
+                entry = journal.get((locale, filename))
+                if (
+                    entry is not None
+                    and entry["update_type"] == update_type
+                    and entry["reference_digest"] == reference_digest
+                    and entry["output_digest"] == task["input_digest"]
+                ):
+                    # Already updated, and not modified since.
+                    skipped_files += 1
+                    continue
+            tasks.append(task)
+
+    return tasks, skipped_files
+
+
+def add_file_metrics(metrics, file_stats):
+    """
+    Add the stats of every task (see new_file_stats) to the run metrics, in
+    total and per locale (see metrics.py).
+    """
+    for stats in file_stats:
+        counts = {
+            "files_processed": int(stats["updated"]),
+            "files_modified": int(stats["modified"]),
+            "parse_errors": int(not stats["updated"]),
+            "units_scanned": stats["units"],
+            "targets_dropped": stats["dropped"],
+            "targets_moved": stats["moved"],
+            "targets_carried_over": stats["carried_over"],
+            "bytes_read": stats["bytes_read"],
+            "bytes_written": stats["bytes_written"],
+        }
+        add_counts(metrics["totals"], counts)
+        add_counts(metrics["locales"].setdefault(stats["locale"], {}), counts)
+        # Summed over all files (and workers), unlike the stages.
+        add_counts(
+            metrics["totals"],
+            {
+                "parse_seconds": stats["parse_seconds"],
+                "update_seconds": stats["update_seconds"],
+                "write_seconds": stats["write_seconds"],
+            },
+        )
+
+
+def load_batch(batch_file):
+    """
+    Read and validate a batch file (see --batch), and return its jobs with
+    absolute paths and default values filled in.
+    """
+    try:
+        with open(batch_file, encoding="utf-8") as f:
+            jobs = json.load(f)
+    except Exception as e:
+        sys.exit(f"ERROR: Can't read batch file {batch_file}\n{e}")
+    if not isinstance(jobs, list) or not jobs:
+        sys.exit(f"ERROR: {batch_file} must contain a non-empty list of jobs")
+
+    batch_folder = os.path.dirname(os.path.realpath(batch_file))
+    for number, job in enumerate(jobs, start=1):
+        if not isinstance(job, dict) or "path" not in job or "reference" not in job:
+            sys.exit(f"ERROR: Job {number} in {batch_file} needs a path and reference")
+        job.setdefault("name", job["path"])
+        job["path"] = os.path.realpath(os.path.join(batch_folder, job["path"]))
+        job.setdefault("project", None)
+        job.setdefault("type", "standard")
+        job.setdefault("locales", [])
+        if job["type"] not in UPDATE_TYPES:
+            sys.exit(f"ERROR: Unknown type '{job['type']}' in job {job['name']}")
+        try:
+            job["config"] = get_project_config(job["project"])
+        except ValueError as e:
+            sys.exit(f"ERROR: {e} (job {job['name']})")
+    return jobs
+
+
+def run_batch(jobs, worker_count, max_memory, locale_major):
+    """
+    Update the locales of every job (see load_batch) on the same scheduler,
+    and print a summary per job.
+    """
+    tasks = []
+    for index, job in enumerate(jobs):
+        base_folder = job["path"]
+        reference_files = list_reference_files(base_folder, job["reference"])
+        locales = job["locales"] or list_locales(
+            base_folder,
+            excluded=job["config"]["excluded_folders"],
+            skip={job["reference"]},
+        )
+        job_tasks, _ = build_tasks(
+            base_folder,
+            job["reference"],
+            reference_files,
+            locales,
+            job["type"],
+            job["config"]["mapping"],
+        )
+        for task in job_tasks:
+            task["job"] = index
+        tasks.extend(job_tasks)
+        job["locale_count"] = len({task["locale"] for task in job_tasks})
+
+    if locale_major:
+        results = schedule_tasks(
+            group_tasks_by_locale(tasks),
+            process_batch_locale_task,
+            worker_count,
+            max_memory,
+        )
+    else:
+        results = schedule_tasks(tasks, process_batch_task, worker_count, max_memory)
+    updated_files = [0] * len(jobs)
+    for index, file_stats in results:
+        updated_files[index] += sum(stats["updated"] for stats in file_stats)
+
+    print("Summary:")
+    for index, job in enumerate(jobs):
+        project = job["project"] or "no project"
+        print(
+            f"  {job['name']} ({project}, {job['type']}): "
+            f"{updated_files[index]} files processed in "
+            f"{job['locale_count']} locales"
+        )
 
 
 def main():
     parser = argparse.ArgumentParser(formatter_class=RawTextHelpFormatter)
     parser.add_argument(
         "--reference",
-        required=True,
+        required=False,
+        default=None,
         dest="reference_locale",
         help="Locale code for source strings (usually en-US)",
     )
     parser.add_argument(
         "--path",
-        required=True,
+        required=False,
+        default=None,
         dest="base_folder",
         help="Path to folder containing subfolders for all locales",
     )
@@ -404,14 +1383,185 @@ def main():
         "Defaults to no mapping and no excluded folders.",
     )
 
+    parser.add_argument(
+        "--since",
+        required=False,
+        default=None,
+        metavar="GIT_REF",
+        help="Only process locales with XLIFF files changed since this git\n"
+        "reference (all locales if the reference locale changed).",
+    )
+
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes used to update locales (default: 1)",
+    )
+
+    parser.add_argument(
+        "--max-memory",
+        type=int,
+        default=None,
+        metavar="MB",
+        help="With --jobs greater than 1, cap the estimated memory of files\n"
+        "being updated at the same time (in MB)",
+    )
+
+    parser.add_argument(
+        "--locale-major",
+        action="store_true",
+        help="Update all the files of a locale in the same task, instead of\n"
+        "one task per file",
+    )
+
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Parse the next files and write the previous ones in background\n"
+        "threads while updating the current one (single process)",
+    )
+
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and update locales whenever the reference or a\n"
+        "localized file changes, reusing parsed files between runs.",
+    )
+
+    parser.add_argument(
+        "--journal",
+        required=False,
+        default=None,
+        metavar="FILE",
+        help="Record each updated file in this journal (JSON Lines)",
+    )
+
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="With --journal, skip files already updated by a previous run\n"
+        "with the same reference and update type",
+    )
+
+    parser.add_argument(
+        "--cache",
+        required=False,
+        default=None,
+        metavar="FOLDER",
+        help="In 'standard' mode, keep a cache of the <file> elements of each\n"
+        "localized file in this folder, to only update the elements with\n"
+        "strings changed in the reference since the previous run",
+    )
+
+    parser.add_argument(
+        "--metrics-file",
+        required=False,
+        default=None,
+        metavar="FILE",
+        help="Write metrics of the run to this file, in JSON format, or in\n"
+        "Prometheus text format if the file name ends with '.prom'",
+    )
+
+    parser.add_argument(
+        "--memory-profile",
+        required=False,
+        default=None,
+        metavar="FILE",
+        help="Record the memory used by each phase of the update, and write\n"
+        "the profile to this file (JSON)",
+    )
+
+    parser.add_argument(
+        "--memory-baseline",
+        required=False,
+        default=None,
+        metavar="FILE",
+        help="With --memory-profile, compare the profile to this one, and\n"
+        "fail if a phase uses more memory",
+    )
+
+    parser.add_argument(
+        "--memory-threshold",
+        type=float,
+        default=10,
+        metavar="PERCENT",
+        help="With --memory-baseline, growth allowed for each phase (default: 10)",
+    )
+
+    parser.add_argument(
+        "--batch",
+        required=False,
+        default=None,
+        metavar="FILE",
+        help="Run the update jobs listed in this JSON file on a shared pool\n"
+        "of workers, instead of a single --path/--reference",
+    )
+
     parser.add_argument(
         "locales",
         nargs="*",
+        default=[],
         help="Locales to process; if none are listed, all locale subfolders "
         "in the path will be processed",
     )
     args = parser.parse_args()
-
+    if args.pipeline and args.jobs > 1:
+        parser.error("--pipeline can't be used with --jobs")
+    if args.pipeline and args.locale_major:
+        parser.error("--pipeline can't be used with --locale-major")
+    if args.max_memory is not None and args.jobs <= 1:
+        # A single job runs tasks one at a time, in order: there is nothing
+        # to cap.
+        parser.error("--max-memory requires --jobs with more than 1 worker")
+    if args.resume and not args.journal:
+        parser.error("--resume requires --journal")
+    if args.watch and args.journal:
+        parser.error("--journal can't be used with --watch")
+    if args.watch and args.metrics_file:
+        parser.error("--metrics-file can't be used with --watch")
+    if args.cache:
+        if args.update_type != "standard":
+            parser.error("--cache can only be used in 'standard' mode")
+        if args.pipeline or args.watch:
+            parser.error("--cache can't be used with --pipeline or --watch")
+    if args.memory_baseline and not args.memory_profile:
+        parser.error("--memory-baseline requires --memory-profile")
+    if args.memory_profile and (args.pipeline or args.watch or args.cache):
+        parser.error(
+            "--memory-profile can't be used with --pipeline, --watch or --cache"
+        )
+    if args.batch:
+        # Options of a single run (set per job in the batch file), as
+        # {option: destination}: any value other than the default is an error.
+        single_run_options = {
+            "--reference": "reference_locale",
+            "--path": "base_folder",
+            "--type": "update_type",
+            "--project": "project",
+            "--since": "since",
+            "--pipeline": "pipeline",
+            "--watch": "watch",
+            "--journal": "journal",
+            "--resume": "resume",
+            "--cache": "cache",
+            "--metrics-file": "metrics_file",
+            "--memory-profile": "memory_profile",
+            "--memory-baseline": "memory_baseline",
+            "--memory-threshold": "memory_threshold",
+            "locales": "locales",
+        }
+        for option, dest in single_run_options.items():
+            if getattr(args, dest) != parser.get_default(dest):
+                parser.error(f"{option} can't be used with --batch")
+        max_memory = args.max_memory * 1024 * 1024 if args.max_memory else None
+        run_batch(load_batch(args.batch), args.jobs, max_memory, args.locale_major)
+        return
+    if args.reference_locale is None or args.base_folder is None:
+        parser.error("--reference and --path are required (or --batch)")
+
+    start = time.perf_counter()
+    metrics = new_metrics("update_other_locales.py")
     reference_locale = args.reference_locale
     update_type = args.update_type
     config = get_project_config(args.project)
@@ -420,16 +1570,8 @@ def main():
 
     # Get a list of files to update (absolute paths)
     base_folder = os.path.realpath(args.base_folder)
-    reference_path = os.path.join(base_folder, reference_locale)
 
-    # Get a list of all the reference XLIFF files
-    reference_files = []
-    for xliff_path in glob(reference_path + "/**/*.xliff", recursive=True):
-        reference_files.append(os.path.relpath(xliff_path, reference_path))
-    if not reference_files:
-        sys.exit(
-            f"No reference file found in {os.path.join(base_folder, reference_locale)}"
-        )
+    reference_files = list_reference_files(base_folder, reference_locale)
 
     # Get the list of locales
     if args.locales:
@@ -439,59 +1581,154 @@ def main():
             base_folder, excluded=excluded_folders, skip={reference_locale}
         )
 
-    updated_files = 0
-    for filename in reference_files:
-        # Read reference XML file
+    if args.since:
         try:
-            reference_file_path = os.path.join(base_folder, reference_locale, filename)
-            reference_tree = etree.parse(reference_file_path)
-            reference_root = reference_tree.getroot()
+            changed_locales = get_changed_locales(base_folder, args.since)
         except Exception as e:
-            sys.exit(f"ERROR: Can't parse reference file {filename}\n{e}")
-
-        # 'standard' only needs an index of the reference sources per ID.
-        # Build once here instead of within the locale loop.
-        reference_index = (
-            build_reference_index(reference_root, filename)
-            if update_type == "standard"
-            else None
-        )
+            sys.exit(f"ERROR: Can't get changed files since {args.since}\n{e}")
+        if reference_locale in changed_locales:
+            # A reference change can invalidate translations in any locale.
+            print(f"Reference changed since {args.since}, processing all locales")
+        else:
+            locales = [locale for locale in locales if locale in changed_locales]
+            print(f"{len(locales)} locales changed since {args.since}")
 
-        for locale in locales:
-            l10n_file = os.path.join(base_folder, locale, filename)
+    if args.watch:
+        try:
+            watch(
+                base_folder,
+                reference_locale,
+                reference_files,
+                locales,
+                update_type,
+                mapping,
+            )
+        except KeyboardInterrupt:
+            print("Stopped watching.")
+        return
+
+    journal_file = None
+    journal = {}
+    if args.journal:
+        journal_file = os.path.realpath(args.journal)
+        if args.resume:
+            journal = load_journal(journal_file)
+        else:
+            # Start over: previous entries don't apply to this run.
+            open(journal_file, "w").close()
 
-            # Every mode requires an existing localized file. In rebuild modes a
-            # missing file would only be recreated with no translations, so its
-            # creation is left to Pontoon.
-            if not os.path.isfile(l10n_file):
-                continue
+    profile = None
+    baseline = None
+    if args.memory_profile:
+        import tracemalloc
 
+        if args.memory_baseline:
             try:
-                locale_tree = etree.parse(l10n_file)
-                locale_root = locale_tree.getroot()
+                baseline = load_profile(args.memory_baseline)
             except Exception as e:
-                print(f"ERROR: Can't parse {l10n_file}")
-                print(e)
-                continue
+                sys.exit(
+                    f"ERROR: Can't read memory baseline {args.memory_baseline}\n{e}"
+                )
+        tracemalloc.start()
+        profile = new_profile("update_other_locales.py")
+        # Parse the reference files here, to record their phases (they're
+        # cached for the tasks).
+        for filename in reference_files:
+            reference_stats = {"memory": {}, "memory_snapshots": True}
+            try:
+                get_reference(
+                    os.path.join(base_folder, reference_locale, filename),
+                    filename,
+                    update_type,
+                    reference_stats,
+                )
+            except Exception as e:
+                sys.exit(f"ERROR: Can't parse reference file {filename}\n{e}")
+            add_phases(profile, reference_locale, reference_stats["memory"])
+
+    with timed_stage(metrics, "prepare"):
+        tasks, skipped_files = build_tasks(
+            base_folder,
+            reference_locale,
+            reference_files,
+            locales,
+            update_type,
+            mapping,
+            journal_file,
+            journal,
+        )
 
-            if update_type == "standard":
-                # In-place update.
-                print(f"Processing {l10n_file} in {update_type} mode")
-                update_in_place(reference_index, locale_root)
-                write_xliff(locale_tree, l10n_file)
-            else:
-                # Rebuild from reference, moving existing translations.
-                print(f"Updating {l10n_file} in {update_type} mode")
-                # Resolve the folder name to its XLIFF target-language code.
-                locale_code = get_locale_code(mapping, locale)
-                new_tree = rebuild_from_reference(
-                    reference_tree, locale_root, update_type, locale_code
+    if skipped_files:
+        print(f"Resuming: {skipped_files} files already updated, skipped.")
+
+    if profile is not None:
+        # tracemalloc snapshots are slow: only take them for the largest
+        # file of each reference file.
+        largest_tasks = {}
+        for task in tasks:
+            task["memory_profile"] = True
+            largest = largest_tasks.get(task["filename"])
+            if largest is None or task["cost"] > largest["cost"]:
+                largest_tasks[task["filename"]] = task
+        for task in largest_tasks.values():
+            task["memory_snapshots"] = True
+
+    if args.cache:
+        from shard_cache import find_dirty_ids, save_reference_snapshot
+
+        cache_folder = os.path.realpath(args.cache)
+        references = {}
+        for filename in reference_files:
+            reference_file_path = os.path.join(base_folder, reference_locale, filename)
+            _, reference_index = get_reference(
+                reference_file_path, filename, update_type
+            )
+            reference_digest = digest_file(reference_file_path)
+            dirty_ids = find_dirty_ids(
+                cache_folder, filename, reference_digest, reference_index
+            )
+            references[filename] = (reference_digest, reference_index, dirty_ids)
+        for task in tasks:
+            reference_digest, _, dirty_ids = references[task["filename"]]
+            task["cache"] = cache_folder
+            task["reference_digest"] = reference_digest
+            task["dirty_ids"] = dirty_ids
+
+    max_memory = args.max_memory * 1024 * 1024 if args.max_memory else None
+    with timed_stage(metrics, "update"):
+        if args.pipeline:
+            from pipeline import run_pipeline
+
+            # Stats are completed by the writer thread: only read them once
+            # the pipeline is done.
+            file_stats = list(
+                run_pipeline(tasks, read_task, transform_task, write_task)
+            )
+        elif args.locale_major:
+            file_stats = [
+                stats
+                for group_stats in schedule_tasks(
+                    group_tasks_by_locale(tasks),
+                    process_locale_task,
+                    args.jobs,
+                    max_memory,
                 )
-                write_xliff(new_tree, l10n_file)
+                for stats in group_stats
+            ]
+        else:
+            file_stats = list(
+                schedule_tasks(tasks, process_task, args.jobs, max_memory)
+            )
+    updated_files = sum(stats["updated"] for stats in file_stats)
 
-            updated_files += 1
+    if args.cache:
+        # Manifests written in this run refer to the current reference.
+        for filename, (reference_digest, reference_index, _) in references.items():
+            save_reference_snapshot(
+                cache_folder, filename, reference_digest, reference_index
+            )
 
-    if updated_files == 0:
+    if updated_files == 0 and not skipped_files:
         # No localized file matched the reference (e.g. a brand-new project that
         # isn't localized yet). This is not an error: exit cleanly so a first
         # import doesn't fail CI, leaving the file creation to Pontoon.
@@ -499,6 +1736,40 @@ def main():
     else:
         print(f"{updated_files} files processed.")
 
+    if args.metrics_file:
+        add_file_metrics(metrics, file_stats)
+        add_counts(
+            metrics["totals"],
+            {
+                "files_skipped": skipped_files,
+                "bytes_read": sum(
+                    os.path.getsize(os.path.join(base_folder, reference_locale, name))
+                    for name in reference_files
+                ),
+            },
+        )
+        metrics["stages"]["total"] = time.perf_counter() - start
+        write_metrics(metrics, args.metrics_file)
+
+    if profile is not None:
+        for stats in file_stats:
+            add_phases(profile, stats["locale"], stats["memory"])
+        record_peak_rss(profile)
+        write_profile(profile, args.memory_profile)
+        print_profile(profile)
+        if baseline is not None:
+            regressions = compare_profiles(profile, baseline, args.memory_threshold)
+            for scope, phase, key, baseline_value, value in regressions:
+                print(
+                    f"WARNING: {key} of phase '{phase}' ({scope}) grew from "
+                    f"{format_size(baseline_value)} to {format_size(value)}"
+                )
+            if regressions:
+                sys.exit(
+                    f"ERROR: {len(regressions)} values grew by more than "
+                    f"{args.memory_threshold:g}% compared to the baseline"
+                )
+
 
 if __name__ == "__main__":
     main()
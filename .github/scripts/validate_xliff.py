@@ -0,0 +1,224 @@
+#! /usr/bin/env python3
+
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+validate_xliff.py --path <folder> [--since <git-ref>] [--jobs <n>]
+     [--json <file>]
+
+ Validate every XLIFF file in the locale folders (reference and templates
+ included), without any network access. Errors are reported per file and
+ line, and the script fails if any file is invalid or can't be parsed.
+
+ Validation has two layers:
+ - The OASIS XLIFF 1.2 strict schema, stored in the repository as
+   'schemas/xliff-core-1.2-strict.xsd' (see the comment at the top of the
+   file for its origin). The W3C schema it imports for xml: attributes is
+   read from 'schemas/xml.xsd'.
+ - iOS rules, on top of the schema (see check_ios_rules):
+   - Xcode writes a 'build-num' attribute on <tool>, which the strict schema
+     doesn't allow: it's accepted, and removed before validating the file
+     against the schema.
+   - Trans-unit IDs must be unique within a <file>, since they're the keys
+     used by Xcode when importing translations.
+
+ --since limits validation to locales with XLIFF files changed since the
+ given git reference (e.g. 'origin/main').
+
+ Files are validated in parallel: each worker process compiles the schema once
+ and reuses it for all the files it validates.
+
+ --json writes the errors to a file as a list of
+ {"file", "line", "column", "message"} objects.
+"""
+
+import argparse
+import json
+import os
+import sys
+from glob import glob
+
+from functions import NS, get_changed_locales, list_locales
+from lxml import etree
+from scheduler import schedule_tasks
+
+SCHEMA_FOLDER = os.path.join(os.path.dirname(__file__), "schemas")
+SCHEMA_PATH = os.path.join(SCHEMA_FOLDER, "xliff-core-1.2-strict.xsd")
+# Schemas imported by the OASIS schema, with their local copy.
+LOCAL_SCHEMAS = {
+    "http://www.w3.org/2001/xml.xsd": os.path.join(SCHEMA_FOLDER, "xml.xsd"),
+}
+
+# Compiled schema, see get_schema().
+_schema = None
+
+
+class LocalSchemaResolver(etree.Resolver):
+    """Resolve the schemas imported by the XLIFF schema to local copies."""
+
+    def resolve(self, url, id, context):
+        if url in LOCAL_SCHEMAS:
+            return self.resolve_filename(LOCAL_SCHEMAS[url], context)
+        return None
+
+
+def get_schema():
+    """
+    Return the compiled XLIFF schema, compiling it only once per process.
+    Imported schemas are resolved from the local 'schemas' folder.
+    """
+    global _schema
+    if _schema is None:
+        parser = etree.XMLParser(no_network=True)
+        parser.resolvers.add(LocalSchemaResolver())
+        _schema = etree.XMLSchema(etree.parse(SCHEMA_PATH, parser))
+    return _schema
+
+
+def check_ios_rules(tree):
+    """
+    Apply the iOS rules (see module docstring) to a parsed XLIFF file: remove
+    the attributes allowed on top of the schema, and return the errors as
+    (line, message) tuples.
+    """
+    errors = []
+    for tool in tree.iterfind(".//x:tool", namespaces=NS):
+        tool.attrib.pop("build-num", None)
+
+    for file_node in tree.iterfind(".//x:file", namespaces=NS):
+        ids = set()
+        for trans_node in file_node.iterfind(".//x:trans-unit", namespaces=NS):
+            tu_id = trans_node.get("id")
+            if tu_id in ids:
+                errors.append(
+                    (
+                        trans_node.sourceline,
+                        f"Duplicated trans-unit ID '{tu_id}' in <file> "
+                        f"'{file_node.get('original')}'",
+                    )
+                )
+            ids.add(tu_id)
+    return errors
+
+
+def validate_file(task):
+    """
+    Validate one XLIFF file and return its errors as a list of dicts, with
+    file paths relative to the task's base folder. Used as the scheduler
+    worker, so it can run in a separate process.
+    """
+    xliff_path = task["path"]
+    relative_path = os.path.relpath(xliff_path, task["base_folder"])
+    parser = etree.XMLParser(no_network=True)
+    try:
+        tree = etree.parse(xliff_path, parser)
+    except etree.XMLSyntaxError:
+        errors = [
+            (error.line, error.column, error.message) for error in parser.error_log
+        ]
+    else:
+        errors = [(line, 0, message) for line, message in check_ios_rules(tree)]
+        schema = get_schema()
+        schema.validate(tree)
+        errors.extend(
+            (error.line, error.column, error.message) for error in schema.error_log
+        )
+
+    return [
+        {
+            "file": relative_path,
+            "line": line,
+            "column": column,
+            "message": message,
+        }
+        for line, column, message in errors
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--path",
+        required=True,
+        dest="base_folder",
+        help="Path to folder including subfolders for all locales",
+    )
+    parser.add_argument(
+        "--since",
+        required=False,
+        default=None,
+        metavar="GIT_REF",
+        help="Only validate locales with XLIFF files changed since this git "
+        "reference.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of worker processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--json",
+        required=False,
+        default=None,
+        dest="json_file",
+        help="Write errors to this file in JSON format",
+    )
+    args = parser.parse_args()
+
+    base_folder = os.path.realpath(args.base_folder)
+    locales = list_locales(base_folder)
+    if args.since:
+        try:
+            changed_locales = get_changed_locales(base_folder, args.since)
+        except Exception as e:
+            sys.exit(f"ERROR: Can't get changed files since {args.since}\n{e}")
+        locales = [locale for locale in locales if locale in changed_locales]
+        if not locales:
+            print(f"No XLIFF file changed since {args.since}.")
+            return
+
+    tasks = []
+    for folder in locales:
+        folder_path = os.path.join(base_folder, folder)
+        for xliff_path in sorted(glob(folder_path + "/**/*.xliff", recursive=True)):
+            tasks.append(
+                {
+                    "path": xliff_path,
+                    "base_folder": base_folder,
+                    "cost": os.path.getsize(xliff_path),
+                }
+            )
+    if not tasks:
+        sys.exit(f"No XLIFF file found in {base_folder}")
+
+    # Compile the schema before starting workers, so a broken schema fails
+    # immediately (and forked workers inherit it).
+    get_schema()
+
+    errors = []
+    for file_errors in schedule_tasks(tasks, validate_file, args.jobs):
+        errors.extend(file_errors)
+    errors.sort(key=lambda error: (error["file"], error["line"], error["column"]))
+
+    if args.json_file:
+        with open(args.json_file, "w", encoding="utf-8") as f:
+            json.dump(errors, f, indent=2, ensure_ascii=False)
+
+    if errors:
+        print("Invalid XLIFF files:")
+        for error in errors:
+            print(
+                f"  {error['file']}:{error['line']}:{error['column']}: "
+                f"{error['message']}"
+            )
+        invalid_files = len({error["file"] for error in errors})
+        sys.exit(f"{len(errors)} errors in {invalid_files} files.")
+
+    print(f"{len(tasks)} files are valid.")
+
+
+if __name__ == "__main__":
+    main()